@@ -0,0 +1,131 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from collections import OrderedDict
+from typing import Optional
+
+import metrics
+from sources import FFMPEG_BEFORE_OPTIONS, TRANSCODE_BITRATE
+
+
+SAFE_KEY = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class AudioCache:
+    def __init__(self, directory: str, max_bytes: int, min_plays: int = 3, max_duration: int = 20 * 60,
+                 max_downloads: int = 2) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self.max_duration = max_duration
+        self.total_bytes = 0
+        self.hits = 0
+        self.logger = logging.getLogger('discord.bot.audio_cache')
+        self._index: OrderedDict[str, int] = OrderedDict()
+        self._plays: OrderedDict[str, int] = OrderedDict()
+        self._downloading: set[str] = set()
+        self._download_slots = asyncio.Semaphore(max_downloads)
+        self._tasks: set[asyncio.Task] = set()
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self) -> None:
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tmp'):
+                os.remove(entry.path)
+            elif entry.name.endswith('.ogg') and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_atime, entry.name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self._index[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    def _file_key(self, key: str) -> str:
+        return key if SAFE_KEY.match(key) else hashlib.sha1(key.encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{self._file_key(key)}.ogg")
+
+    def __contains__(self, key: str) -> bool:
+        return self._file_key(key) in self._index
+
+    def lookup(self, key: str) -> Optional[str]:
+        file_key = self._file_key(key)
+        if file_key not in self._index:
+            return None
+        path = self.path(key)
+        if not os.path.exists(path):
+            self.total_bytes -= self._index.pop(file_key)
+            return None
+        self._index.move_to_end(file_key)
+        self.hits += 1
+        return path
+
+    def record_play(self, key: str, stream_url: str, acodec: str, duration: int) -> None:
+        file_key = self._file_key(key)
+        if file_key in self._index or file_key in self._downloading:
+            return
+        if not duration or duration > self.max_duration:
+            return
+        plays = self._plays.pop(file_key, 0) + 1
+        self._plays[file_key] = plays
+        while len(self._plays) > 10000:
+            self._plays.popitem(last=False)
+        if plays < self.min_plays:
+            return
+        self._downloading.add(file_key)
+        task = asyncio.create_task(self._store(file_key, stream_url, acodec))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _store(self, file_key: str, stream_url: str, acodec: str) -> None:
+        path = os.path.join(self.directory, f"{file_key}.ogg")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        codec_args = ['-c:a', 'copy'] if acodec == 'opus' else ['-c:a', 'libopus', '-b:a', f'{TRANSCODE_BITRATE}k']
+        args = ['ffmpeg', '-nostdin', '-loglevel', 'error', *FFMPEG_BEFORE_OPTIONS.split(), '-i', stream_url,
+                '-vn', '-map_metadata', '-1', *codec_args, '-f', 'ogg', tmp_path]
+        try:
+            async with self._download_slots:
+                process = await asyncio.create_subprocess_exec(
+                    *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+                )
+                metrics.ACTIVE_FFMPEG.inc()
+                try:
+                    returncode = await process.wait()
+                except asyncio.CancelledError:
+                    process.kill()
+                    raise
+                finally:
+                    metrics.ACTIVE_FFMPEG.dec()
+            if returncode != 0:
+                raise RuntimeError(f"ffmpeg exited with {returncode}")
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+            self._index[file_key] = size
+            self.total_bytes += size
+            self._plays.pop(file_key, None)
+            self.logger.info(f"Cached audio for {file_key} ({size // 1024} KiB)")
+            self._evict()
+        except Exception as e:
+            self.logger.warning(f"Failed to cache audio for {file_key}: {e}")
+        finally:
+            self._downloading.discard(file_key)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _evict(self) -> None:
+        while self.total_bytes > self.max_bytes and self._index:
+            file_key, size = self._index.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(os.path.join(self.directory, f"{file_key}.ogg"))
+            except FileNotFoundError:
+                pass
+
+    def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
@@ -0,0 +1,304 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from typing import Any, Callable, Optional
+import discord
+import yt_dlp
+
+import metrics
+
+
+FRAME_SECONDS = 0.02
+
+
+class StubYoutubeDL:
+    latency: float = 0.05
+    jitter: float = 0.02
+    failure_rate: float = 0.0
+    playlist_size: int = 200
+    track_seconds: float = 3.0
+    calls: int = 0
+    _lock = threading.Lock()
+
+    def __init__(self, params: Optional[dict] = None) -> None:
+        self.params = params or {}
+        self.rng = random.Random()
+
+    def _sleep(self) -> None:
+        with StubYoutubeDL._lock:
+            StubYoutubeDL.calls += 1
+        time.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+
+    def _entry(self, playlist_id: str, index: int) -> dict:
+        return {'id': f"{playlist_id}-{index}", 'url': f"https://www.youtube.com/watch?v={playlist_id}-{index}",
+                'title': f"Benchmark track {index}", 'duration': self.track_seconds, 'uploader': f"Channel {index % 7}"}
+
+    def _entries(self, playlist_id: str):
+        for index in range(self.playlist_size):
+            yield self._entry(playlist_id, index)
+
+    def extract_info(self, url: str, download: bool = False, process: bool = True) -> dict:
+        self._sleep()
+        if 'list=' in url:
+            playlist_id = url.split('list=')[1].split('&')[0]
+            entries = self._entries(playlist_id)
+            return {'_type': 'playlist', 'id': playlist_id, 'title': f"Benchmark playlist {playlist_id}",
+                    'webpage_url': url, 'entries': entries if not process else list(entries)}
+        if self.rng.random() < self.failure_rate:
+            raise yt_dlp.DownloadError("ERROR: Video unavailable. This video is not available")
+        video_id = url.rsplit('v=', 1)[-1]
+        stream_url = f"https://bench.invalid/audio/{video_id}?expire={int(time.time()) + 6 * 60 * 60}"
+        return {
+            'id': video_id, 'title': f"Benchmark video {video_id}", 'webpage_url': url,
+            'duration': self.track_seconds, 'uploader': 'Benchmark', 'thumbnail': '',
+            'url': stream_url, 'acodec': 'opus', 'ext': 'webm',
+            'formats': [{'url': stream_url, 'acodec': 'opus', 'ext': 'webm', 'vcodec': 'none', 'abr': 128,
+                         'protocol': 'https'}],
+        }
+
+
+class FakeOpusAudio(discord.AudioSource):
+    spawn_latency: float = 0.03
+    active: int = 0
+
+    def __init__(self, url: str, **kwargs: Any) -> None:
+        self.url = url
+        self.frames = int(StubYoutubeDL.track_seconds / FRAME_SECONDS)
+        self._spawned = False
+        FakeOpusAudio.active += 1
+
+    def read(self) -> bytes:
+        if not self._spawned:
+            self._spawned = True
+            time.sleep(self.spawn_latency)
+        if self.frames <= 0:
+            return b''
+        self.frames -= 1
+        return b'\xf8\xff\xfe'
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self) -> None:
+        if self.frames is not None:
+            self.frames = None
+            FakeOpusAudio.active -= 1
+
+
+class FakeVoiceClient:
+    def __init__(self, on_first_frame: Callable[[], None]) -> None:
+        self.on_first_frame = on_first_frame
+        self.tracks_started = 0
+        self._playing = False
+        self._paused = False
+        self._stop = threading.Event()
+
+    def is_connected(self) -> bool:
+        return True
+
+    def is_playing(self) -> bool:
+        return self._playing
+
+    def is_paused(self) -> bool:
+        return self._paused
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def play(self, source: discord.AudioSource, after: Callable[[Optional[Exception]], None]) -> None:
+        self._stop = stop = threading.Event()
+        self._playing = True
+        self.tracks_started += 1
+
+        def run() -> None:
+            first = True
+            next_frame = time.perf_counter()
+            while not stop.is_set():
+                if not source.read():
+                    break
+                if first:
+                    first = False
+                    self.on_first_frame()
+                next_frame += FRAME_SECONDS
+                delay = next_frame - time.perf_counter()
+                if delay > 0:
+                    stop.wait(delay)
+            self._playing = False
+            source.cleanup()
+            after(None)
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+class FakeMessage:
+    def __init__(self, channel: 'FakeChannel', message_id: int) -> None:
+        self.channel = channel
+        self.id = message_id
+
+    async def edit(self, **kwargs: Any) -> 'FakeMessage':
+        self.channel.edits += 1
+        await asyncio.sleep(self.channel.latency)
+        return self
+
+    async def delete(self) -> None:
+        await asyncio.sleep(self.channel.latency)
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, latency: float) -> None:
+        self.id = channel_id
+        self.latency = latency
+        self.sends = 0
+        self.edits = 0
+
+    async def send(self, content: Optional[str] = None, **kwargs: Any) -> FakeMessage:
+        self.sends += 1
+        await asyncio.sleep(self.latency)
+        return FakeMessage(self, self.sends)
+
+
+class FakeContext:
+    def __init__(self, guild_id: int, latency: float) -> None:
+        self.guild = types.SimpleNamespace(id=guild_id)
+        self.channel = FakeChannel(guild_id, latency)
+        self.author = types.SimpleNamespace(mention=f"<@{guild_id}>", voice=None)
+
+    async def send(self, content: Optional[str] = None, **kwargs: Any) -> FakeMessage:
+        return await self.channel.send(content, **kwargs)
+
+    async def defer(self) -> None:
+        await asyncio.sleep(self.channel.latency)
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def monitor_loop_lag(samples: list[float], stop: asyncio.Event, interval: float = 0.05) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append((time.perf_counter() - started - interval) * 1000)
+
+
+async def run_guild(bot, guild_id: int, args: argparse.Namespace, results: dict) -> None:
+    rng = random.Random(guild_id)
+    ctx = FakeContext(guild_id, args.discord_latency)
+    started = time.perf_counter()
+    first_frame: list[float] = []
+    voice = FakeVoiceClient(lambda: first_frame or first_frame.append(time.perf_counter()))
+
+    span = metrics.Span('play')
+    await ctx.defer()
+    await asyncio.sleep(args.connect_latency)
+    span.mark('voice_connected')
+    player = await bot.get_player(ctx.guild)
+    await player.add_to_queue(ctx, f"https://www.youtube.com/playlist?list=bench{guild_id}", voice, span)
+
+    deadline = started + args.duration
+    while time.perf_counter() < deadline and (player.running_queue or player.queue):
+        await asyncio.sleep(rng.uniform(0.2, 1.0))
+        if rng.random() < args.skip_rate and voice.is_playing():
+            voice.stop()
+            results['skips'] += 1
+    results['tracks'] += voice.tracks_started
+    results['messages'] += ctx.channel.sends + ctx.channel.edits
+    if first_frame:
+        results['first_audio_ms'].append((first_frame[0] - started) * 1000)
+    player.stop()
+
+
+async def run(args: argparse.Namespace) -> dict:
+    StubYoutubeDL.latency = args.ytdl_latency
+    StubYoutubeDL.failure_rate = args.failure_rate
+    StubYoutubeDL.playlist_size = args.playlist_size
+    StubYoutubeDL.track_seconds = args.track_seconds
+    FakeOpusAudio.spawn_latency = args.ffmpeg_latency
+    yt_dlp.YoutubeDL = StubYoutubeDL
+    discord.FFmpegOpusAudio = FakeOpusAudio
+
+    import main
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    async with main.Bot('/', discord.Intents.default()) as bot:
+        lag_samples: list[float] = []
+        stop = asyncio.Event()
+        monitor = asyncio.create_task(monitor_loop_lag(lag_samples, stop))
+        results: dict[str, Any] = {'tracks': 0, 'skips': 0, 'messages': 0, 'first_audio_ms': []}
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run_guild(bot, guild_id, args, results) for guild_id in range(1, args.guilds + 1)))
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        stop.set()
+        await monitor
+
+    first_audio = results['first_audio_ms']
+    return {
+        'guilds': args.guilds,
+        'elapsed_s': round(elapsed, 2),
+        'tracks_started': results['tracks'],
+        'tracks_per_s': round(results['tracks'] / elapsed, 2),
+        'skips': results['skips'],
+        'extractions': StubYoutubeDL.calls,
+        'extraction_errors': dict(metrics.EXTRACTION_ERRORS.values),
+        'discord_messages': results['messages'],
+        'time_to_first_audio_ms': {
+            'p50': round(percentile(first_audio, 0.5), 1),
+            'p95': round(percentile(first_audio, 0.95), 1),
+            'max': round(max(first_audio, default=0), 1),
+        },
+        'loop_lag_ms': {
+            'p50': round(percentile(lag_samples, 0.5), 2),
+            'p99': round(percentile(lag_samples, 0.99), 2),
+            'max': round(max(lag_samples, default=0), 2),
+        },
+        'peak_memory_per_guild_kib': round((peak - baseline) / args.guilds / 1024, 1),
+        'leaked_ffmpeg': FakeOpusAudio.active,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline YoutuBot load test with stubbed yt-dlp and voice clients")
+    parser.add_argument('--guilds', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30, help="seconds each guild keeps playing")
+    parser.add_argument('--playlist-size', type=int, default=200)
+    parser.add_argument('--track-seconds', type=float, default=3, help="length of each fake track")
+    parser.add_argument('--skip-rate', type=float, default=0.3, help="chance of a skip at each guild tick")
+    parser.add_argument('--failure-rate', type=float, default=0.05, help="share of videos that fail to resolve")
+    parser.add_argument('--ytdl-latency', type=float, default=0.05)
+    parser.add_argument('--ffmpeg-latency', type=float, default=0.03)
+    parser.add_argument('--connect-latency', type=float, default=0.1)
+    parser.add_argument('--discord-latency', type=float, default=0.02)
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['CACHE_PATH'] = os.path.join(directory, 'benchmark.sqlite3')
+        os.environ['QUEUE_JOURNAL_PATH'] = os.path.join(directory, 'queues.sqlite3')
+        os.environ['EXTRACTION_BACKEND'] = 'thread'
+        os.environ.pop('AUDIO_CACHE_DIR', None)
+        report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in report.items():
+            print(f"{key}: {value}")
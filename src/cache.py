@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sources import select_audio_format, stream_expires_at
+
+
+METADATA_TTL = 7 * 24 * 60 * 60
+PLAYLIST_TTL = 60 * 60
+NEGATIVE_TTLS: dict[str, float] = {
+    'age_restricted': 24 * 60 * 60,
+    'unavailable': 6 * 60 * 60,
+}
+
+
+def _thumbnail(info: dict) -> str:
+    if info.get('thumbnail'):
+        return info['thumbnail']
+    thumbnails = info.get('thumbnails') or []
+    return thumbnails[-1].get('url', '') if thumbnails else ''
+
+
+def compact_entry(entry: dict) -> dict:
+    return {
+        'id': entry.get('id'),
+        'url': entry.get('url'),
+        'title': entry.get('title') or 'Unknown',
+        'duration': entry.get('duration'),
+        'uploader': entry.get('uploader') or entry.get('channel'),
+        'thumbnail': _thumbnail(entry),
+    }
+
+
+def compact_info(info: dict) -> dict:
+    if 'entries' in info:
+        return {
+            'title': info.get('title') or 'Unknown Playlist',
+            'webpage_url': info.get('webpage_url'),
+            'entries': [compact_entry(entry) for entry in info['entries'] if entry],
+        }
+
+    compact = {
+        'id': info.get('id'),
+        'title': info.get('title') or 'Unknown',
+        'duration': info.get('duration'),
+        'uploader': info.get('uploader') or info.get('channel'),
+        'thumbnail': _thumbnail(info),
+        'webpage_url': info.get('webpage_url') or info.get('original_url'),
+    }
+    fmt = select_audio_format(info)
+    if fmt:
+        compact['url'] = fmt['url']
+        compact['acodec'] = fmt.get('acodec')
+        compact['ext'] = fmt.get('ext')
+        compact['stream_expires_at'] = stream_expires_at(fmt['url'], time.time())
+    return compact
+
+
+class MetadataCache:
+    def __init__(self, path: str, memory_limit: int = 512, disk_limit: int = 50000,
+                 metadata_ttl: float = METADATA_TTL, playlist_ttl: float = PLAYLIST_TTL) -> None:
+        self.path = path
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self.metadata_ttl = metadata_ttl
+        self.playlist_ttl = playlist_ttl
+        self.hits = 0
+        self.misses = 0
+        self.logger = logging.getLogger('discord.bot.cache')
+        self._memory: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS metadata ('
+            'key TEXT PRIMARY KEY, payload TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS metadata_accessed ON metadata (accessed_at)')
+
+    def _remember(self, key: str, payload: dict, expires_at: float) -> None:
+        self._memory[key] = (payload, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_limit:
+            self._memory.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[tuple[dict, float]]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute('SELECT payload, expires_at FROM metadata WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._db.execute('DELETE FROM metadata WHERE key = ?', (key,))
+                return None
+            self._db.execute('UPDATE metadata SET accessed_at = ? WHERE key = ?', (now, key))
+        return json.loads(row[0]), row[1]
+
+    def _store(self, key: str, payload: dict, expires_at: float) -> None:
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO metadata (key, payload, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(payload, separators=(',', ':')), expires_at, time.time())
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict()
+
+    def _evict(self) -> None:
+        self._db.execute('DELETE FROM metadata WHERE expires_at <= ?', (time.time(),))
+        count = self._db.execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
+        if count > self.disk_limit:
+            self._db.execute(
+                'DELETE FROM metadata WHERE key IN (SELECT key FROM metadata ORDER BY accessed_at LIMIT ?)',
+                (count - self.disk_limit,)
+            )
+
+    async def get(self, key: str, require_stream: bool = False) -> Optional[dict]:
+        cached = self._memory.get(key)
+        if cached is not None:
+            self._memory.move_to_end(key)
+        else:
+            try:
+                cached = await asyncio.to_thread(self._load, key)
+            except sqlite3.Error as e:
+                self.logger.warning(f"Metadata cache read failed: {e}")
+                cached = None
+            if cached is not None:
+                self._remember(key, *cached)
+
+        now = time.time()
+        if cached is None or cached[1] <= now:
+            if cached is not None:
+                self._memory.pop(key, None)
+            self.misses += 1
+            return None
+
+        payload = cached[0]
+        if require_stream and payload.get('stream_expires_at', 0) <= now:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return payload
+
+    async def put(self, key: str, payload: dict, ttl: Optional[float] = None) -> None:
+        if ttl is None:
+            ttl = self.playlist_ttl if 'entries' in payload else self.metadata_ttl
+        expires_at = time.time() + ttl
+        self._remember(key, payload, expires_at)
+        try:
+            await asyncio.to_thread(self._store, key, payload, expires_at)
+        except sqlite3.Error as e:
+            self.logger.warning(f"Metadata cache write failed: {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class NegativeCache:
+    def __init__(self, limit: int = 10000, ttls: Optional[dict[str, float]] = None) -> None:
+        self.limit = limit
+        self.ttls = dict(NEGATIVE_TTLS if ttls is None else ttls)
+        self.hits = 0
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        cached = self._entries.get(key)
+        if cached is None:
+            return None
+        error, expires_at = cached
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return error
+
+    def put(self, key: str, error: str) -> None:
+        ttl = self.ttls.get(error)
+        if not ttl:
+            return
+        self._entries[key] = (error, time.time() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.limit:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,394 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from enum import IntEnum
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Optional
+from urllib.parse import parse_qs, urlparse
+
+import metrics
+from cache import compact_entry, compact_info
+from sources import YTDL_FORMAT
+
+if TYPE_CHECKING:
+    import yt_dlp
+
+
+YDL_OPTIONS: dict[str, Any] = {
+    'source_address': '0.0.0.0',
+    'format': YTDL_FORMAT,
+    'noplaylist': False,
+    'default_search': 'ytsearch',
+    'quiet': True,
+    'no_warnings': True,
+    'nocheckcertificate': True,
+    'ignoreerrors': False,
+    'logtostderr': False,
+    'no_color': True,
+    'extractor_retries': 1,
+    'skip_download': True,
+}
+
+AGE_RESTRICTED_PATTERN = re.compile(r'\bage\b|age[- ]restricted|inappropriate for some users')
+YOUTUBE_HOSTS = ('youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com', 'youtube-nocookie.com',
+                 'www.youtube-nocookie.com')
+YOUTUBE_ID_PATHS = ('/shorts/', '/embed/', '/live/', '/v/')
+
+logger = logging.getLogger('discord.bot.extraction')
+_local = threading.local()
+
+
+def _get_ytdl(extract_flat: bool) -> 'yt_dlp.YoutubeDL':
+    import yt_dlp
+
+    instances = getattr(_local, 'instances', None)
+    if instances is None:
+        instances = _local.instances = {}
+    ytdl = instances.get(extract_flat)
+    if ytdl is None:
+        ytdl = instances[extract_flat] = yt_dlp.YoutubeDL({**YDL_OPTIONS, 'extract_flat': extract_flat})
+    return ytdl
+
+
+def warm_up() -> None:
+    _get_ytdl(False)
+    _get_ytdl(True)
+
+
+def youtube_video_id(url: str) -> Optional[str]:
+    parsed = urlparse(url)
+    host = parsed.netloc.lower()
+    if host in ('youtu.be', 'www.youtu.be'):
+        return parsed.path.strip('/').split('/')[0] or None
+    if host not in YOUTUBE_HOSTS:
+        return None
+    if parsed.path == '/watch':
+        return parse_qs(parsed.query).get('v', [None])[0]
+    for prefix in YOUTUBE_ID_PATHS:
+        if parsed.path.startswith(prefix):
+            return parsed.path[len(prefix):].split('/')[0] or None
+    return None
+
+
+def video_key(url: str) -> str:
+    return youtube_video_id(url) or normalize_url(url)
+
+
+def is_playlist_url(url: str) -> bool:
+    parsed = urlparse(url)
+    return parsed.netloc.lower() in YOUTUBE_HOSTS and 'list' in parse_qs(parsed.query)
+
+
+def normalize_url(url: str, extract_flat: bool = False) -> str:
+    url = url.strip()
+    if not url.startswith(('http://', 'https://')):
+        return ' '.join(url.split())
+
+    parsed = urlparse(url)
+    video_id = youtube_video_id(url)
+    playlist_id = parse_qs(parsed.query).get('list', [None])[0] if parsed.netloc.lower() in YOUTUBE_HOSTS + ('youtu.be',) else None
+    if video_id and playlist_id and extract_flat:
+        return f"https://www.youtube.com/watch?v={video_id}&list={playlist_id}"
+    if video_id:
+        return f"https://www.youtube.com/watch?v={video_id}"
+    if playlist_id:
+        return f"https://www.youtube.com/playlist?list={playlist_id}"
+    return parsed._replace(fragment='').geturl()
+
+
+def classify_error(error: Exception) -> str:
+    error_msg = str(error).lower()
+    if 'not a bot' in error_msg:
+        return "bot_check"
+    elif 'private' in error_msg or 'not available' in error_msg or 'removed' in error_msg:
+        return "unavailable"
+    elif AGE_RESTRICTED_PATTERN.search(error_msg):
+        return "age_restricted"
+    return "download_error"
+
+
+def extract(url: str, extract_flat: bool) -> tuple[Optional[dict], Optional[str]]:
+    import yt_dlp
+
+    try:
+        info = _get_ytdl(extract_flat).extract_info(url, download=False)
+    except yt_dlp.DownloadError as e:
+        error = classify_error(e)
+        if error == "download_error":
+            logger.error(f"yt-dlp error: {e}")
+        elif error == "bot_check":
+            logger.warning(f"YouTube is rate limiting this host with a bot check: {e}")
+        return None, error
+    except Exception as e:
+        logger.error(f"Unexpected error extracting info: {e}")
+        return None, "unknown_error"
+
+    if not info:
+        return None, "unknown_error"
+    return compact_info(info), None
+
+
+class StreamCancelled(Exception):
+    pass
+
+
+def stream_playlist(url: str, page_size: int, emit: Callable[[str, Any], None]) -> None:
+    import yt_dlp
+
+    try:
+        try:
+            ytdl = _get_ytdl(True)
+            info = ytdl.extract_info(url, download=False, process=False)
+            for _ in range(3):
+                if not info or info.get('_type') not in ('url', 'url_transparent'):
+                    break
+                info = ytdl.extract_info(info['url'], download=False, process=False)
+
+            if not info or 'entries' not in info:
+                emit('error', "not_playlist")
+                return
+
+            emit('playlist', {'title': info.get('title') or 'Unknown Playlist', 'webpage_url': info.get('webpage_url')})
+            page = []
+            for entry in info['entries']:
+                if entry:
+                    page.append(compact_entry(entry))
+                if len(page) >= page_size:
+                    emit('entries', page)
+                    page = []
+            if page:
+                emit('entries', page)
+        except yt_dlp.DownloadError as e:
+            emit('error', classify_error(e))
+        except StreamCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error streaming playlist: {e}")
+            emit('error', "unknown_error")
+    except StreamCancelled:
+        logger.debug(f"Playlist stream cancelled for {url}")
+
+
+class Priority(IntEnum):
+    NOW_PLAYING = 0
+    INTERACTIVE = 1
+    BACKFILL = 2
+
+
+class ExtractionJob:
+    __slots__ = ('url', 'extract_flat', 'priority', 'guild_id', 'guild_ids', 'waiters', 'started', 'future')
+
+    def __init__(self, url: str, extract_flat: bool, priority: Priority, guild_id: Optional[int]) -> None:
+        self.url = url
+        self.extract_flat = extract_flat
+        self.priority = priority
+        self.guild_id = guild_id
+        self.guild_ids: set[Optional[int]] = {guild_id}
+        self.waiters = 0
+        self.started = False
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class ExtractionPool:
+    def __init__(self, backend: str = 'thread', workers: int = 4, max_pending: int = 64, timeout: float = 60,
+                 class_limits: Optional[dict[Priority, int]] = None, stream_workers: int = 2,
+                 stream_buffer: int = 2) -> None:
+        if backend not in ('thread', 'process'):
+            raise ValueError(f"Unknown extraction backend: {backend}")
+        self.backend = backend
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.class_limits: dict[Priority, int] = {
+            Priority.NOW_PLAYING: workers,
+            Priority.INTERACTIVE: workers,
+            Priority.BACKFILL: max(1, workers // 2),
+        }
+        self.class_limits.update(class_limits or {})
+        self.running: dict[Priority, int] = {priority: 0 for priority in Priority}
+        self._queues: dict[Priority, OrderedDict[Optional[int], deque[ExtractionJob]]] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self._slots: dict[Priority, asyncio.Semaphore] = {priority: asyncio.Semaphore(max_pending) for priority in Priority}
+        self._inflight: dict[tuple[str, bool], ExtractionJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.stream_buffer = stream_buffer
+        self.stream_workers = stream_workers
+        self._stream_executor = ThreadPoolExecutor(max_workers=stream_workers, thread_name_prefix='ytdl-stream')
+        self._executor: Executor
+        if backend == 'process':
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ytdl')
+
+    def warm_up(self) -> None:
+        loop = asyncio.get_running_loop()
+        for _ in range(self.workers):
+            self.running[Priority.BACKFILL] += 1
+            self._executor.submit(warm_up).add_done_callback(
+                lambda _: loop.is_closed() or loop.call_soon_threadsafe(self._release, Priority.BACKFILL)
+            )
+        for _ in range(self.stream_workers):
+            self._stream_executor.submit(_get_ytdl, True)
+
+    def pending(self, priority: Optional[Priority] = None) -> int:
+        priorities = [priority] if priority is not None else list(Priority)
+        return sum(len(jobs) for p in priorities for jobs in self._queues[p].values())
+
+    def _next_job(self) -> Optional[ExtractionJob]:
+        for priority in Priority:
+            if self.running[priority] >= self.class_limits[priority]:
+                continue
+            guilds = self._queues[priority]
+            while guilds:
+                guild_id, jobs = next(iter(guilds.items()))
+                job = jobs.popleft()
+                if jobs:
+                    guilds.move_to_end(guild_id)
+                else:
+                    del guilds[guild_id]
+                if not job.future.done():
+                    return job
+        return None
+
+    def _dispatch(self) -> None:
+        while sum(self.running.values()) < self.workers:
+            job = self._next_job()
+            if job is None:
+                return
+            job.started = True
+            self.running[job.priority] += 1
+            task = asyncio.create_task(self._execute(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _release(self, priority: Priority) -> None:
+        self.running[priority] -= 1
+        self._dispatch()
+
+    async def _execute(self, job: ExtractionJob) -> None:
+        loop = asyncio.get_running_loop()
+        future = self._executor.submit(extract, job.url, job.extract_flat)
+        future.add_done_callback(
+            lambda _: loop.is_closed() or loop.call_soon_threadsafe(self._release, job.priority)
+        )
+        started_at = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Extraction timed out for {job.url}")
+            result = None, "timeout"
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"Extraction worker failed for {job.url}: {e}")
+            result = None, "unknown_error"
+        metrics.EXTRACTION_MS.observe((time.perf_counter() - started_at) * 1000)
+        if result[1]:
+            metrics.EXTRACTION_ERRORS.inc(result[1])
+        if not job.future.done():
+            job.future.set_result(result)
+
+    def _enqueue(self, job: ExtractionJob) -> None:
+        self._queues[job.priority].setdefault(job.guild_id, deque()).append(job)
+
+    def _promote(self, job: ExtractionJob, priority: Priority) -> None:
+        jobs = self._queues[job.priority].get(job.guild_id)
+        if jobs is None or job not in jobs:
+            return
+        jobs.remove(job)
+        if not jobs:
+            del self._queues[job.priority][job.guild_id]
+        job.priority = priority
+        self._enqueue(job)
+        self._dispatch()
+
+    def _finish(self, key: tuple[str, bool], job: ExtractionJob, slots: asyncio.Semaphore) -> None:
+        slots.release()
+        if self._inflight.get(key) is job:
+            del self._inflight[key]
+
+    async def submit(self, url: str, extract_flat: bool = False, priority: Priority = Priority.INTERACTIVE,
+                     guild_id: Optional[int] = None) -> tuple[Optional[dict], Optional[str]]:
+        key = (url, extract_flat)
+        job = self._inflight.get(key)
+        if job is None:
+            slots = self._slots[priority]
+            await slots.acquire()
+            job = self._inflight.get(key)
+            if job is None:
+                job = ExtractionJob(url, extract_flat, priority, guild_id)
+                self._inflight[key] = job
+                job.future.add_done_callback(lambda _, job=job, slots=slots: self._finish(key, job, slots))
+                self._enqueue(job)
+                self._dispatch()
+            else:
+                slots.release()
+
+        if job.waiters:
+            metrics.EXTRACTION_COALESCED.inc()
+        job.waiters += 1
+        job.guild_ids.add(guild_id)
+        if priority < job.priority and not job.started:
+            self._promote(job, priority)
+
+        try:
+            return await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            if not job.future.done():
+                job.waiters -= 1
+                if job.waiters == 0:
+                    job.future.cancel()
+            raise
+
+    def cancel_guild(self, guild_id: int) -> None:
+        for guilds in self._queues.values():
+            for jobs in guilds.values():
+                for job in jobs:
+                    job.guild_ids.discard(guild_id)
+                    if not job.guild_ids:
+                        job.future.cancel()
+
+    async def stream(self, url: str, page_size: int = 50) -> AsyncIterator[tuple[str, Any]]:
+        loop = asyncio.get_running_loop()
+        items: asyncio.Queue[tuple[str, Any]] = asyncio.Queue()
+        credits = threading.Semaphore(self.stream_buffer)
+        cancelled = threading.Event()
+
+        def emit(kind: str, payload: Any) -> None:
+            while not credits.acquire(timeout=1):
+                if cancelled.is_set():
+                    raise StreamCancelled()
+            if cancelled.is_set():
+                raise StreamCancelled()
+            loop.call_soon_threadsafe(items.put_nowait, (kind, payload))
+
+        def run() -> None:
+            try:
+                stream_playlist(url, page_size, emit)
+            finally:
+                if not cancelled.is_set():
+                    loop.call_soon_threadsafe(items.put_nowait, ('done', None))
+
+        future = loop.run_in_executor(self._stream_executor, run)
+        try:
+            while True:
+                kind, payload = await items.get()
+                if kind == 'done':
+                    break
+                credits.release()
+                yield kind, payload
+        finally:
+            cancelled.set()
+            if not future.done():
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def shutdown(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._stream_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from track import Track
+
+
+FLUSH_INTERVAL = 0.5
+
+
+class GuildJournal:
+    def __init__(self, journal: 'QueueJournal', guild_id: int, head: int = 0, tail: int = 0) -> None:
+        self.journal = journal
+        self.guild_id = guild_id
+        self.head = head
+        self.tail = tail
+        self.channel_id: Optional[int] = None
+
+    def _put(self, position: int, track: Track) -> None:
+        self.journal.record('INSERT OR REPLACE INTO tracks (guild_id, position, payload) VALUES (?, ?, ?)',
+                            (self.guild_id, position, json.dumps(track.to_dict(), separators=(',', ':'))))
+
+    def set_channel(self, channel_id: int) -> None:
+        if channel_id == self.channel_id:
+            return
+        self.channel_id = channel_id
+        self.journal.record('INSERT OR REPLACE INTO queues (guild_id, channel_id, updated_at) VALUES (?, ?, ?)',
+                            (self.guild_id, channel_id, time.time()))
+
+    def append(self, track: Track) -> None:
+        self._put(self.tail, track)
+        self.tail += 1
+
+    def prepend(self, track: Track) -> None:
+        self.head -= 1
+        self._put(self.head, track)
+
+    def popleft(self) -> None:
+        self.settle()
+        self.head += 1
+
+    def settle(self) -> None:
+        self.journal.record('DELETE FROM tracks WHERE guild_id = ? AND position < ?', (self.guild_id, self.head))
+
+    def replace(self, tracks: list[Track]) -> None:
+        self.journal.record('DELETE FROM tracks WHERE guild_id = ? AND position >= ?', (self.guild_id, self.head))
+        self.tail = self.head
+        for track in tracks:
+            self.append(track)
+
+    def clear(self) -> None:
+        self.journal.record('DELETE FROM tracks WHERE guild_id = ?', (self.guild_id,))
+        self.journal.record('DELETE FROM queues WHERE guild_id = ?', (self.guild_id,))
+        self.head = self.tail = 0
+        self.channel_id = None
+
+
+class QueueJournal:
+    def __init__(self, path: str, flush_interval: float = FLUSH_INTERVAL) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.logger = logging.getLogger('discord.bot.journal')
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._pending: list[tuple[str, tuple[Any, ...]]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS queues (guild_id INTEGER PRIMARY KEY, channel_id INTEGER, updated_at REAL)')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS tracks ('
+            'guild_id INTEGER NOT NULL, position INTEGER NOT NULL, payload TEXT NOT NULL, PRIMARY KEY (guild_id, position))'
+        )
+
+    def guild(self, guild_id: int) -> GuildJournal:
+        return GuildJournal(self, guild_id)
+
+    def record(self, sql: str, params: tuple[Any, ...]) -> None:
+        with self._lock:
+            self._pending.append((sql, params))
+        if self._task is None or self._task.done():
+            try:
+                self._task = asyncio.get_running_loop().create_task(self._flush_later())
+            except RuntimeError:
+                self.flush()
+
+    async def _flush_later(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except sqlite3.Error as e:
+                self.logger.warning(f"Queue journal write failed: {e}")
+            with self._lock:
+                if not self._pending:
+                    return
+
+    def flush(self) -> None:
+        with self._db_lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        self._db.execute('BEGIN')
+        try:
+            for sql, params in pending:
+                self._db.execute(sql, params)
+            self._db.execute('COMMIT')
+        except sqlite3.Error:
+            self._db.execute('ROLLBACK')
+            with self._lock:
+                self._pending = pending + self._pending
+            raise
+
+    def summary(self) -> list[tuple[int, Optional[int], int]]:
+        with self._db_lock:
+            self._flush_locked()
+            return self._db.execute(
+                'SELECT tracks.guild_id, queues.channel_id, COUNT(*) FROM tracks '
+                'LEFT JOIN queues ON queues.guild_id = tracks.guild_id GROUP BY tracks.guild_id'
+            ).fetchall()
+
+    def restore(self, guild_id: int) -> tuple[GuildJournal, list[Track]]:
+        with self._db_lock:
+            self._flush_locked()
+            rows = self._db.execute('SELECT position, payload FROM tracks WHERE guild_id = ? ORDER BY position',
+                                    (guild_id,)).fetchall()
+            channel = self._db.execute('SELECT channel_id FROM queues WHERE guild_id = ?', (guild_id,)).fetchone()
+        tracks = []
+        for _, payload in rows:
+            try:
+                tracks.append(Track.from_dict(json.loads(payload)))
+            except (TypeError, ValueError) as e:
+                self.logger.warning(f"Dropped unreadable journal entry for guild {guild_id}: {e}")
+        head = rows[0][0] if rows else 0
+        tail = rows[-1][0] + 1 if rows else 0
+        guild_journal = GuildJournal(self, guild_id, head, tail)
+        guild_journal.channel_id = channel[0] if channel else None
+        if len(tracks) != len(rows):
+            guild_journal.replace(tracks)
+        return guild_journal, tracks
+
+    def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+        with self._db_lock:
+            try:
+                self._flush_locked()
+            except sqlite3.Error as e:
+                self.logger.warning(f"Queue journal write failed: {e}")
+            self._db.close()
@@ -0,0 +1,169 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Optional
+from dotenv import load_dotenv
+
+
+GATEWAY_URL = 'https://discord.com/api/v10/gateway/bot'
+IDENTIFY_INTERVAL = 5.0
+RESTART_BACKOFF_MAX = 60.0
+STABLE_UPTIME = 60.0
+SHUTDOWN_TIMEOUT = 30.0
+MAIN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+logger = logging.getLogger('discord.bot.launcher')
+
+
+def recommended_shards(token: str) -> tuple[int, int]:
+    request = urllib.request.Request(GATEWAY_URL, headers={'Authorization': f"Bot {token}",
+                                                           'User-Agent': 'YoutuBot launcher'})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        data = json.load(response)
+    return int(data['shards']), int(data.get('session_start_limit', {}).get('max_concurrency', 1))
+
+
+def split_shards(shard_count: int, processes: int) -> list[list[int]]:
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    ranges = []
+    start = 0
+    for index in range(processes):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+class Worker:
+    def __init__(self, index: int, shard_ids: list[int], shard_count: int, workers: int) -> None:
+        self.index = index
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.workers = workers
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at = 0.0
+        self.failures = 0
+        self.restart_at: Optional[float] = None
+
+    def __str__(self) -> str:
+        return f"worker {self.index} (shards {self.shard_ids[0]}-{self.shard_ids[-1]})"
+
+    def environment(self) -> dict[str, str]:
+        env = dict(os.environ)
+        env['SHARD_COUNT'] = str(self.shard_count)
+        env['SHARD_IDS'] = ','.join(str(shard_id) for shard_id in self.shard_ids)
+        metrics_port = int(env.get('METRICS_PORT', 0))
+        if metrics_port:
+            env['METRICS_PORT'] = str(metrics_port + self.index)
+        if env.get('AUDIO_CACHE_DIR'):
+            env['AUDIO_CACHE_DIR'] = os.path.join(env['AUDIO_CACHE_DIR'], f"worker-{self.index}")
+            env['AUDIO_CACHE_MAX_BYTES'] = str(int(env.get('AUDIO_CACHE_MAX_BYTES', 2 * 1024 ** 3)) // self.workers)
+        return env
+
+    def start(self) -> None:
+        self.process = subprocess.Popen([sys.executable, MAIN_PATH], env=self.environment(),
+                                        start_new_session=True)
+        self.started_at = time.monotonic()
+        self.restart_at = None
+        logger.info(f"Started {self} as pid {self.process.pid}")
+
+    def poll(self) -> Optional[int]:
+        if self.process is None:
+            return None
+        code = self.process.poll()
+        if code is None:
+            return None
+        self.process = None
+        if code == 0:
+            logger.info(f"{self} exited cleanly")
+            return code
+        self.failures = 1 if time.monotonic() - self.started_at > STABLE_UPTIME else self.failures + 1
+        delay = min(RESTART_BACKOFF_MAX, 2.0 ** self.failures)
+        self.restart_at = time.monotonic() + delay
+        logger.warning(f"{self} exited with code {code}, restarting in {delay:.0f}s")
+        return code
+
+    def stop(self) -> None:
+        if self.process is not None and self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+
+    def wait(self, deadline: float) -> None:
+        if self.process is None:
+            return
+        try:
+            self.process.wait(max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            logger.warning(f"{self} did not shut down in time, killing it")
+            self.process.kill()
+            self.process.wait()
+
+
+def run(workers: list[Worker], stagger: float) -> None:
+    stopping = False
+
+    def request_stop(signum: int, frame) -> None:
+        nonlocal stopping
+        stopping = True
+
+    def pause(seconds: float) -> None:
+        deadline = time.monotonic() + seconds
+        while not stopping and time.monotonic() < deadline:
+            time.sleep(min(0.5, deadline - time.monotonic()))
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    for worker in workers:
+        if stopping:
+            break
+        worker.start()
+        if worker is not workers[-1]:
+            pause(stagger * len(worker.shard_ids))
+
+    while not stopping and any(worker.process or worker.restart_at for worker in workers):
+        now = time.monotonic()
+        for worker in workers:
+            worker.poll()
+            if worker.restart_at is not None and worker.restart_at <= now:
+                worker.start()
+        time.sleep(1)
+
+    logger.info("Shutting down workers")
+    for worker in workers:
+        worker.stop()
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+    for worker in workers:
+        worker.wait(deadline)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run YoutuBot as several sharded worker processes")
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help="worker processes to spread the shards over (default: one per core)")
+    parser.add_argument('--shards', type=int, default=int(os.getenv('SHARD_COUNT', 0)),
+                        help="total shard count (default: SHARD_COUNT, or the count Discord recommends)")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    shard_count, max_concurrency = args.shards, 1
+    if not shard_count:
+        shard_count, max_concurrency = recommended_shards(os.getenv('DISCORD_TOKEN'))
+    ranges = split_shards(shard_count, args.processes)
+    workers = [Worker(index, shard_ids, shard_count, len(ranges)) for index, shard_ids in enumerate(ranges)]
+    logger.info(f"Launching {shard_count} shards across {len(workers)} processes")
+    run(workers, IDENTIFY_INTERVAL / max_concurrency)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv()
+    main()
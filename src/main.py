@@ -1,87 +1,90 @@
 import asyncio
+import hashlib
+import json
 import os
-from typing import Optional
+import signal
+import sqlite3
+from typing import Any, AsyncIterator, Optional
 import discord
-from discord import ui
-from discord.ext import commands
+from discord.ext import commands, tasks
 from dotenv import load_dotenv
-import yt_dlp
-from collections import deque
 import logging
-import gc
 
-
-class MusicControlView(ui.View):
-    def __init__(self, bot):
-        super().__init__(timeout=None)
-        self.bot = bot
-    
-    @ui.button(label="⏸️ Pause", style=discord.ButtonStyle.primary, custom_id="pause_button")
-    async def pause_button(self, interaction: discord.Interaction, button: ui.Button):
-        voice = discord.utils.get(self.bot.voice_clients, guild=interaction.guild)
-        if voice and voice.is_playing():
-            voice.pause()
-            await interaction.response.send_message("⏸️ Paused", ephemeral=True)
-        else:
-            await interaction.response.send_message("❌ Nothing is playing!", ephemeral=True)
-    
-    @ui.button(label="▶️ Resume", style=discord.ButtonStyle.success, custom_id="resume_button")
-    async def resume_button(self, interaction: discord.Interaction, button: ui.Button):
-        voice = discord.utils.get(self.bot.voice_clients, guild=interaction.guild)
-        if voice and voice.is_paused():
-            voice.resume()
-            await interaction.response.send_message("▶️ Resumed", ephemeral=True)
-        else:
-            await interaction.response.send_message("❌ Nothing is paused!", ephemeral=True)
-    
-    @ui.button(label="⏭️ Skip", style=discord.ButtonStyle.secondary, custom_id="skip_button")
-    async def skip_button(self, interaction: discord.Interaction, button: ui.Button):
-        voice = discord.utils.get(self.bot.voice_clients, guild=interaction.guild)
-        if voice and (voice.is_playing() or voice.is_paused()):
-            voice.stop()
-            await interaction.response.send_message("⏭️ Skipped", ephemeral=True)
-        else:
-            await interaction.response.send_message("❌ Nothing is playing!", ephemeral=True)
-    
-    @ui.button(label="⏹️ Stop", style=discord.ButtonStyle.danger, custom_id="stop_button")
-    async def stop_button(self, interaction: discord.Interaction, button: ui.Button):
-        voice = discord.utils.get(self.bot.voice_clients, guild=interaction.guild)
-        if voice and (voice.is_playing() or voice.is_paused()):
-            voice.stop()
-            self.bot.queue.clear()
-            self.bot.running_queue = False
-            await interaction.response.send_message("⏹️ Stopped and cleared queue", ephemeral=True)
-        else:
-            await interaction.response.send_message("❌ Nothing is playing!", ephemeral=True)
-    
-    @ui.button(label="📜 Queue", style=discord.ButtonStyle.secondary, custom_id="queue_button")
-    async def queue_button(self, interaction: discord.Interaction, button: ui.Button):
-        if self.bot.queue:
-            embed = discord.Embed(title="📜 Queue", color=discord.Color.blue())
-            queue_list = '\n'.join([f"`{i+1}.` {video.get('title', 'Unknown')[:60]}" 
-                                   for i, video in enumerate(list(self.bot.queue)[:10])])
-            embed.description = queue_list
-            
-            if len(self.bot.queue) > 10:
-                embed.set_footer(text=f"... and {len(self.bot.queue) - 10} more songs")
-            else:
-                embed.set_footer(text=f"Total: {len(self.bot.queue)} songs")
-            
-            await interaction.response.send_message(embed=embed, ephemeral=True)
-        else:
-            await interaction.response.send_message("📭 The queue is empty!", ephemeral=True)
-
-
-class Bot(commands.Bot):
-    def __init__(self, command_prefix: str, intents: discord.Intents) -> None:
-        super().__init__(command_prefix=command_prefix, intents=intents)
-        self.queue: deque[dict] = deque()
-        self.running_queue: bool = False
+import metrics
+from audio_cache import AudioCache
+from cache import METADATA_TTL, PLAYLIST_TTL, MetadataCache, NegativeCache
+from extraction import ExtractionPool, Priority, normalize_url, video_key
+from journal import QueueJournal
+from player import GuildPlayer
+from supervisor import FFmpegSupervisor
+from views import QueueView
+
+
+class Bot(commands.AutoShardedBot):
+    def __init__(self, command_prefix: str, intents: discord.Intents, **options: Any) -> None:
+        super().__init__(command_prefix=command_prefix, intents=intents, **options)
+        self.players: dict[int, GuildPlayer] = {}
+        self.player_idle_timeout: float = float(os.getenv('PLAYER_IDLE_TIMEOUT', 300))
+        self.voice_alone_timeout: float = float(os.getenv('VOICE_ALONE_TIMEOUT', 60))
+        self.resolve_lookahead: int = int(os.getenv('RESOLVE_LOOKAHEAD', 2))
+        self.playlist_page_size: int = int(os.getenv('PLAYLIST_PAGE_SIZE', 50))
+        self.playlist_cache_limit: int = int(os.getenv('PLAYLIST_CACHE_LIMIT', 1000))
+        self.max_queue_length: int = int(os.getenv('MAX_QUEUE_LENGTH', 5000))
+        self.max_queue_bytes: int = int(os.getenv('MAX_QUEUE_BYTES', 4 * 1024 ** 2))
         self.voice_clients_map: dict[discord.VoiceChannel, discord.VoiceClient] = {}
         self.logger = logging.getLogger('discord.bot')
-        self.current_player_message: Optional[discord.Message] = None
-        self._video_cache: dict[str, dict] = {}
-        self._cache_limit = 50
+        self.metadata_cache = MetadataCache(
+            os.getenv('CACHE_PATH', 'youtubot_cache.sqlite3'),
+            memory_limit=int(os.getenv('CACHE_MEMORY_ENTRIES', 512)),
+            disk_limit=int(os.getenv('CACHE_DISK_ENTRIES', 50000)),
+            metadata_ttl=float(os.getenv('CACHE_METADATA_TTL', METADATA_TTL)),
+            playlist_ttl=float(os.getenv('CACHE_PLAYLIST_TTL', PLAYLIST_TTL))
+        )
+        self.audio_cache: Optional[AudioCache] = None
+        if os.getenv('AUDIO_CACHE_DIR'):
+            self.audio_cache = AudioCache(
+                os.getenv('AUDIO_CACHE_DIR'),
+                max_bytes=int(os.getenv('AUDIO_CACHE_MAX_BYTES', 2 * 1024 ** 3)),
+                min_plays=int(os.getenv('AUDIO_CACHE_MIN_PLAYS', 3))
+            )
+        self.negative_cache = NegativeCache(limit=int(os.getenv('NEGATIVE_CACHE_ENTRIES', 10000)))
+        self.extraction = ExtractionPool(
+            backend=os.getenv('EXTRACTION_BACKEND', 'thread'),
+            workers=int(os.getenv('EXTRACTION_WORKERS', 4)),
+            max_pending=int(os.getenv('EXTRACTION_MAX_PENDING', 64)),
+            timeout=float(os.getenv('EXTRACTION_TIMEOUT', 60)),
+            class_limits={Priority.BACKFILL: int(os.getenv('EXTRACTION_BACKFILL_WORKERS', 2))}
+        )
+        self.journal: Optional[QueueJournal] = None
+        if os.getenv('QUEUE_JOURNAL_PATH', 'youtubot_queues.sqlite3'):
+            self.journal = QueueJournal(os.getenv('QUEUE_JOURNAL_PATH', 'youtubot_queues.sqlite3'))
+        self.restored_announced = False
+        self._restoring: dict[int, asyncio.Task] = {}
+        self.ffmpeg = FFmpegSupervisor(
+            max_processes=int(os.getenv('FFMPEG_MAX_PROCESSES', 32)),
+            niceness=int(os.getenv('FFMPEG_NICENESS', 5)),
+            stall_timeout=float(os.getenv('FFMPEG_STALL_TIMEOUT', 20)),
+            idle_timeout=float(os.getenv('FFMPEG_IDLE_TIMEOUT', 900)),
+            admission_timeout=float(os.getenv('FFMPEG_ADMISSION_TIMEOUT', 10))
+        )
+        self.command_hash_path: str = os.getenv('COMMAND_HASH_PATH', 'youtubot_commands.sha256')
+        self.commands_synced = False
+        self.metrics_host: str = os.getenv('METRICS_HOST', '127.0.0.1')
+        self.metrics_port: int = int(os.getenv('METRICS_PORT', 0))
+        self.metrics_runner = None
+        metrics.gauge('active_players', 'Guild players currently held in memory', lambda: len(self.players))
+        metrics.gauge('queued_tracks', 'Songs waiting in all guild queues',
+                      lambda: sum(len(player.queue) for player in self.players.values()))
+        metrics.gauge('max_queue_depth', 'Longest guild queue',
+                      lambda: max((len(player.queue) for player in self.players.values()), default=0))
+        metrics.gauge('extraction_pending', 'Extraction jobs waiting for a worker', self.extraction.pending)
+        metrics.gauge('metadata_cache_hits', 'Metadata cache hits since startup', lambda: self.metadata_cache.hits)
+        metrics.gauge('metadata_cache_misses', 'Metadata cache misses since startup', lambda: self.metadata_cache.misses)
+        metrics.gauge('metadata_cache_hit_ratio', 'Share of metadata lookups answered from the cache',
+                      lambda: self.metadata_cache.hits / max(1, self.metadata_cache.hits + self.metadata_cache.misses))
+        metrics.gauge('negative_cache_hits', 'Lookups short-circuited by the negative cache', lambda: self.negative_cache.hits)
+        metrics.gauge('audio_cache_hits', 'Tracks played from the local audio cache',
+                      lambda: self.audio_cache.hits if self.audio_cache else 0)
 
     async def join_vc(self, ctx: commands.Context) -> discord.VoiceClient or None:
         if not ctx.author.voice:
@@ -94,310 +97,197 @@ class Bot(commands.Bot):
             voice: discord.VoiceClient = await voice_channel.connect()
         return voice
 
-    async def extract_info(self, url: str, extract_flat: bool = False) -> tuple[Optional[dict], Optional[str]]:
-        cache_key = f"{url}_{extract_flat}"
-        if cache_key in self._video_cache and not extract_flat:
-            self.logger.info(f"Cache hit for {url}")
-            return self._video_cache[cache_key], None
-        
-        ydl_opts: dict[str, any] = {
-            'source_address': '0.0.0.0',
-            'format': 'bestaudio/best',
-            'noplaylist': False,
-            'default_search': 'ytsearch',
-            'extract_flat': extract_flat,
-            'quiet': True,
-            'no_warnings': True,
-            'nocheckcertificate': True,
-            'ignoreerrors': False,
-            'logtostderr': False,
-            'no_color': True,
-            'extractor_retries': 1,
-            'skip_download': True,
-        }
-
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ytdl:
-                info = await asyncio.to_thread(ytdl.extract_info, url, download=False)
-                
-                if info and not extract_flat:
-                    if len(self._video_cache) >= self._cache_limit:
-                        self._video_cache.pop(next(iter(self._video_cache)))
-                    self._video_cache[cache_key] = info
-                
-                return info, None
-        except yt_dlp.DownloadError as e:
-            error_msg = str(e).lower()
-            if 'sign in' in error_msg or 'age' in error_msg or 'private' in error_msg:
-                return None, "age_restricted"
-            elif 'not available' in error_msg or 'removed' in error_msg:
-                return None, "unavailable"
-            self.logger.error(f"yt-dlp error: {e}")
-            return None, "download_error"
-        except Exception as e:
-            self.logger.error(f"Unexpected error extracting info: {e}")
-            return None, "unknown_error"
-
-    def create_now_playing_embed(self, video_info: dict) -> discord.Embed:
-        title = video_info.get('title', 'Unknown')
-        if len(title) > 100:
-            title = title[:97] + "..."
-        
-        embed = discord.Embed(
-            title="🎵 Now Playing",
-            description=f"**[{title}]({video_info.get('webpage_url', '')})**",
-            color=discord.Color.green()
-        )
-        
-        thumbnail = video_info.get('thumbnail')
-        if thumbnail:
-            embed.set_thumbnail(url=thumbnail)
-        
-        uploader = video_info.get('uploader')
-        if uploader:
-            if len(uploader) > 50:
-                uploader = uploader[:47] + "..."
-            embed.add_field(name="Channel", value=uploader, inline=True)
-        
-        duration = video_info.get('duration')
-        if duration:
-            minutes, seconds = divmod(duration, 60)
-            hours, minutes = divmod(minutes, 60)
-            duration_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
-            embed.add_field(name="Duration", value=duration_str, inline=True)
-        
-        embed.set_footer(text=f"Queue: {len(self.queue)} songs")
-        
-        return embed
-
-    async def play_video(self, ctx: commands.Context, video_info: dict, voice: discord.VoiceClient) -> None:
-        if voice.is_playing():
-            self.logger.warning(f"Already playing audio, cannot start: {video_info.get('title')}")
+    async def extract_info(self, url: str, extract_flat: bool = False, priority: Priority = Priority.INTERACTIVE,
+                           guild_id: Optional[int] = None) -> tuple[Optional[dict], Optional[str]]:
+        url = normalize_url(url, extract_flat)
+        negative_key = video_key(url)
+        error = self.negative_cache.get(negative_key)
+        if error:
+            self.logger.debug(f"Negative cache hit for {url} ({error})")
+            return None, error
+
+        cache_key = f"{'flat' if extract_flat else 'video'}:{url}"
+        cached = await self.metadata_cache.get(cache_key, require_stream=not extract_flat)
+        if cached:
+            self.logger.debug(f"Cache hit for {url}")
+            return cached, None
+
+        info, error = await self.extraction.submit(url, extract_flat, priority=priority, guild_id=guild_id)
+        if not info:
+            self.negative_cache.put(negative_key, error)
+            return None, error
+
+        await self.metadata_cache.put(cache_key, info)
+        if 'url' in info and info.get('webpage_url') and info['webpage_url'] != url:
+            await self.metadata_cache.put(f"video:{info['webpage_url']}", info)
+        return info, None
+
+    async def stream_playlist(self, url: str) -> AsyncIterator[tuple[str, Any]]:
+        url = normalize_url(url, extract_flat=True)
+        cache_key = f"flat:{url}"
+        cached = await self.metadata_cache.get(cache_key)
+        if cached and 'entries' in cached:
+            self.logger.debug(f"Cache hit for {url}")
+            yield 'playlist', {'title': cached.get('title'), 'webpage_url': cached.get('webpage_url')}
+            yield 'entries', cached['entries']
             return
-        
-        if voice.is_paused():
-            voice.stop()
-            await asyncio.sleep(0.5)
-        
-        ffmpeg_options: dict[str, str] = {
-            'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -probesize 32M -analyzeduration 0',
-            'options': '-vn -b:a 128k'
-        }
-
-        async def play_next():
-            if self.queue:
-                await asyncio.sleep(0.3)
-                if not voice.is_playing():
-                    next_video = self.queue.popleft()
-                    await self.play_video(ctx, next_video, voice)
-            else:
-                self.running_queue = False
 
-        def after(e: Optional[Exception]) -> None:
-            if e:
-                self.logger.error(f'Player error: {e}')
-            
-            asyncio.run_coroutine_threadsafe(play_next(), self.loop)
+        listing: Optional[dict] = None
+        async for kind, payload in self.extraction.stream(url, page_size=self.playlist_page_size):
+            if kind == 'playlist':
+                listing = {**payload, 'entries': []}
+            elif kind == 'entries' and listing is not None:
+                if len(listing['entries']) + len(payload) <= self.playlist_cache_limit:
+                    listing['entries'].extend(payload)
+                else:
+                    listing = None
+            yield kind, payload
+            if kind == 'error':
+                return
 
+        if listing is not None and listing['entries']:
+            await self.metadata_cache.put(cache_key, listing)
+
+    async def get_player(self, guild: discord.Guild) -> GuildPlayer:
+        player = self.players.get(guild.id)
+        if player is not None:
+            return player
+        if self.journal:
+            task = self._restoring.get(guild.id)
+            if task is None:
+                task = self._restoring[guild.id] = asyncio.create_task(self._restore_player(guild.id))
+            return await asyncio.shield(task)
+        player = self.players[guild.id] = GuildPlayer(self, guild.id)
+        return player
+
+    async def _restore_player(self, guild_id: int) -> GuildPlayer:
         try:
-            embed = self.create_now_playing_embed(video_info)
-            view = MusicControlView(self)
-            self.current_player_message = await ctx.send(embed=embed, view=view)
-            voice.play(discord.FFmpegOpusAudio(video_info['url'], **ffmpeg_options), after=after)
-            
-            if 'formats' in video_info:
-                del video_info['formats']
-            if 'thumbnails' in video_info:
-                del video_info['thumbnails']
-            if 'automatic_captions' in video_info:
-                del video_info['automatic_captions']
-            if 'subtitles' in video_info:
-                del video_info['subtitles']
-        except discord.ClientException as e:
-            self.logger.error(f"Discord client error: {e}")
-            await ctx.send(f"❌ Audio player error: {str(e)}")
-            self.running_queue = False
-        except Exception as e:
-            self.logger.error(f"Error playing video: {e}")
-            await ctx.send(f"❌ Failed to play: {video_info.get('title', 'Unknown')}")
-            if self.queue and not voice.is_playing():
-                next_video = self.queue.popleft()
-                await self.play_video(ctx, next_video, voice)
-            else:
-                self.running_queue = False
-
-    async def add_to_queue(self, ctx: commands.Context, url: str, voice: discord.VoiceClient) -> None:
-        loading_msg = await ctx.send("🔍 Fetching video information...")
-        
-        info, error = await self.extract_info(url, extract_flat=True)
-        
-        if not info:
-            if error == "age_restricted":
-                await loading_msg.edit(content=f'🔞 This video is age-restricted or requires sign-in. The bot cannot play it without authentication.')
-            elif error == "unavailable":
-                await loading_msg.edit(content=f'❌ This video is unavailable, private, or has been removed.')
-            else:
-                await loading_msg.edit(content=f'❌ URL not supported or couldn\'t fetch info, {ctx.author.mention}!')
+            restored = await asyncio.to_thread(self.journal.restore, guild_id)
+        except sqlite3.Error as e:
+            self.logger.warning(f"Failed to restore the saved queue for guild {guild_id}: {e}")
+            restored = None
+        finally:
+            self._restoring.pop(guild_id, None)
+        player = self.players[guild_id] = GuildPlayer(self, guild_id)
+        if restored:
+            player.restore(*restored)
+        return player
+
+    def command_signature(self) -> str:
+        commands_payload = sorted((command.to_dict(self.tree) for command in self.tree.get_commands()),
+                                  key=lambda command: (command.get('type', 1), command['name']))
+        payload = json.dumps({'application_id': self.application_id, 'commands': commands_payload},
+                             sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    async def sync_commands(self) -> None:
+        if self.commands_synced or (self.shard_ids and 0 not in self.shard_ids):
             return
-
-        is_playlist = 'entries' in info
-        playlist_info = []
-        
-        if is_playlist:
-            playlist_title = info.get('title', 'Unknown Playlist')
-            entries = [e for e in info['entries'] if e]
-            
-            if not entries:
-                await loading_msg.edit(content="❌ No videos found in this playlist!")
-                return
-            
-            embed = discord.Embed(
-                title="📋 Loading Playlist",
-                description=f"**{playlist_title}**\nAdding {len(entries)} videos...",
-                color=discord.Color.blue()
-            )
-            await loading_msg.edit(content=None, embed=embed)
-            
-            for entry in entries:
-                video_url = entry.get('url') or f"https://www.youtube.com/watch?v={entry['id']}"
-                playlist_info.append({
-                    'url': video_url,
-                    'title': entry.get('title', 'Unknown')
-                })
-        else:
-            if 'url' not in info:
-                info, error = await self.extract_info(url, extract_flat=False)
-            
-            if info and 'url' in info:
-                lightweight_info = {
-                    'url': info['url'],
-                    'title': info.get('title', 'Unknown'),
-                    'webpage_url': info.get('webpage_url', ''),
-                    'thumbnail': info.get('thumbnail', ''),
-                    'uploader': info.get('uploader', ''),
-                    'duration': info.get('duration', 0)
-                }
-                self.queue.append(lightweight_info)
-                
-                if self.running_queue:
-                    embed = discord.Embed(
-                        title="✅ Added to Queue",
-                        description=f"**[{lightweight_info['title']}]({lightweight_info.get('webpage_url', '')})**",
-                        color=discord.Color.green()
-                    )
-                    if lightweight_info.get('thumbnail'):
-                        embed.set_thumbnail(url=lightweight_info['thumbnail'])
-                    embed.add_field(name="Position", value=f"#{len(self.queue)}", inline=True)
-                    if lightweight_info.get('duration'):
-                        minutes, seconds = divmod(lightweight_info['duration'], 60)
-                        embed.add_field(name="Duration", value=f"{minutes:02d}:{seconds:02d}", inline=True)
-                    await loading_msg.edit(content=None, embed=embed)
-                else:
-                    self.running_queue = True
-                    await loading_msg.delete()
-                    await self.play_video(ctx, lightweight_info, voice)
-            else:
-                if error == "age_restricted":
-                    await loading_msg.edit(content='🔞 This video is age-restricted. The bot cannot play it without YouTube account authentication.')
-                elif error == "unavailable":
-                    await loading_msg.edit(content='❌ This video is unavailable, private, or has been removed.')
-                else:
-                    await loading_msg.edit(content="❌ Couldn't fetch video info!")
+        signature = self.command_signature()
+        if self.command_hash_path:
+            try:
+                with open(self.command_hash_path) as f:
+                    if f.read().strip() == signature:
+                        self.commands_synced = True
+                        self.logger.info("Slash commands unchanged since the last sync, skipping it")
+                        return
+            except OSError:
+                pass
+        try:
+            synced = await self.tree.sync()
+        except discord.HTTPException as e:
+            self.logger.warning(f"Failed to sync slash commands: {e}")
             return
-
-        added_count = 0
-        skipped_count = 0
-        age_restricted_count = 0
-        first_video = None
-        
-        batch_size = 3
-        for batch_start in range(0, len(playlist_info), batch_size):
-            batch = playlist_info[batch_start:batch_start + batch_size]
-            
-            tasks = [self.extract_info(vid['url'], extract_flat=False) for vid in batch]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            for idx, (video_data, result) in enumerate(zip(batch, results)):
-                if isinstance(result, Exception):
-                    skipped_count += 1
-                    self.logger.warning(f"Exception processing video: {result}")
-                    continue
-                
-                video_info, error = result
-                
-                if video_info and 'url' in video_info:
-                    lightweight_info = {
-                        'url': video_info['url'],
-                        'title': video_info.get('title', 'Unknown'),
-                        'webpage_url': video_info.get('webpage_url', ''),
-                        'thumbnail': video_info.get('thumbnail', ''),
-                        'uploader': video_info.get('uploader', ''),
-                        'duration': video_info.get('duration', 0)
-                    }
-                    
-                    if first_video is None and not self.running_queue:
-                        first_video = lightweight_info
-                    else:
-                        self.queue.append(lightweight_info)
-                    added_count += 1
-                else:
-                    if error == "age_restricted":
-                        age_restricted_count += 1
-                        self.logger.warning(f"Skipped age-restricted video: {video_data['title']}")
-                    else:
-                        skipped_count += 1
-                        self.logger.warning(f"Skipped invalid video: {video_data['url']}")
-            
-            current_pos = batch_start + len(batch)
-            if current_pos % 15 == 0 or current_pos == len(playlist_info):
-                status = f"**{playlist_title}**\nAdded {added_count}/{len(playlist_info)} videos..."
-                if skipped_count > 0:
-                    status += f"\n⚠️ Skipped {skipped_count} (unavailable/private)"
-                if age_restricted_count > 0:
-                    status += f"\n🔞 Skipped {age_restricted_count} (age-restricted)"
-                embed.description = status
-                try:
-                    await loading_msg.edit(embed=embed)
-                except discord.HTTPException:
-                    pass
-
-        if added_count == 0:
-            error_msg = "❌ No valid videos could be added!"
-            if age_restricted_count > 0:
-                error_msg += f"\n🔞 {age_restricted_count} videos were age-restricted (bot needs YouTube account)"
-            if skipped_count > 0:
-                error_msg += f"\n⚠️ {skipped_count} videos were unavailable/private"
-            await loading_msg.edit(content=error_msg, embed=None)
+        self.commands_synced = True
+        self.logger.info(f"Synced {len(synced)} slash commands")
+        if self.command_hash_path:
+            try:
+                with open(f"{self.command_hash_path}.tmp", 'w') as f:
+                    f.write(signature)
+                os.replace(f"{self.command_hash_path}.tmp", self.command_hash_path)
+            except OSError as e:
+                self.logger.warning(f"Failed to save the slash command hash: {e}")
+
+    async def announce_restored_queues(self) -> None:
+        if not self.journal or self.restored_announced:
             return
-
-        embed = discord.Embed(
-            title="✅ Playlist Added",
-            description=f"**{playlist_title}**\nSuccessfully added {added_count} videos!",
-            color=discord.Color.green()
-        )
-        
-        if skipped_count > 0 or age_restricted_count > 0:
-            warnings = []
-            if skipped_count > 0:
-                warnings.append(f"⚠️ {skipped_count} unavailable/private")
-            if age_restricted_count > 0:
-                warnings.append(f"🔞 {age_restricted_count} age-restricted")
-            embed.add_field(name="Skipped", value=" | ".join(warnings), inline=False)
-        
-        embed.add_field(name="Queue Size", value=f"{len(self.queue)} songs", inline=True)
-        await loading_msg.edit(content=None, embed=embed)
-        
-        if first_video:
-            self.running_queue = True
-            self.logger.info(f"Starting playlist playback with: {first_video.get('title')}")
-            await self.play_video(ctx, first_video, voice)
-        elif not self.running_queue and self.queue:
-            self.running_queue = True
-            first_video = self.queue.popleft()
-            self.logger.info(f"Starting playlist from queue: {first_video.get('title')}")
-            await self.play_video(ctx, first_video, voice)
-        
-        gc.collect()
+        self.restored_announced = True
+        for guild_id, channel_id, count in await asyncio.to_thread(self.journal.summary):
+            channel = self.get_channel(channel_id) if channel_id else None
+            if channel is None or guild_id in self.players or guild_id in self._restoring:
+                continue
+            try:
+                await channel.send(f"🔁 Restored {count} queued songs from before the restart. Use /resume to keep "
+                                   f"listening, songs added with /play are queued after them.")
+            except discord.HTTPException as e:
+                self.logger.warning(f"Failed to announce restored queue in guild {guild_id}: {e}")
+
+    async def release_player(self, guild_id: int, reason: str, notice: Optional[str] = None) -> None:
+        player = self.players.pop(guild_id, None)
+        if player is not None:
+            await player.teardown(notice)
+        self.logger.info(f"Released player for guild {guild_id} ({reason})")
+
+    @tasks.loop(seconds=15)
+    async def evict_idle_players(self) -> None:
+        for guild_id, player in list(self.players.items()):
+            if player.is_alone(self.voice_alone_timeout):
+                await self.release_player(guild_id, "alone in voice", "👋 Left the voice channel because everyone left.")
+            elif player.is_idle(self.player_idle_timeout):
+                notice = "👋 Left the voice channel due to inactivity." if player.voice else None
+                await self.release_player(guild_id, "idle", notice)
+        for voice in list(self.voice_clients):
+            if voice.guild.id in self.players or voice.guild.id in self._restoring:
+                continue
+            if voice.is_connected() and not voice.is_playing():
+                await voice.disconnect()
+                self.logger.info(f"Disconnected unused voice client in guild {voice.guild.id}")
+
+    async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState,
+                                    after: discord.VoiceState) -> None:
+        player = self.players.get(member.guild.id)
+        if player is None:
+            return
+        if member.id == self.user.id:
+            if after.channel is None:
+                await self.release_player(member.guild.id, "disconnected from voice")
+            else:
+                player.update_listeners(after.channel)
+            return
+        voice = member.guild.voice_client
+        if voice and voice.channel in (before.channel, after.channel):
+            player.update_listeners(voice.channel)
+
+    @tasks.loop(seconds=5)
+    async def supervise_ffmpeg(self) -> None:
+        self.ffmpeg.check()
+
+    @tasks.loop(minutes=5)
+    async def log_metrics(self) -> None:
+        metrics.log_summary(self.logger)
+
+    async def setup_hook(self) -> None:
+        self.extraction.warm_up()
+        self.evict_idle_players.start()
+        self.supervise_ffmpeg.start()
+        self.log_metrics.start()
+        if self.metrics_port:
+            self.metrics_runner = await metrics.start_server(self.metrics_host, self.metrics_port)
+            self.logger.info(f"Serving metrics on http://{self.metrics_host}:{self.metrics_port}/metrics")
+
+    async def close(self) -> None:
+        if self.journal:
+            for player in self.players.values():
+                player.queue.journal = None
+            self.journal.close()
+        await super().close()
+        self.ffmpeg.shutdown()
+        if self.metrics_runner:
+            await self.metrics_runner.cleanup()
+        self.extraction.shutdown()
+        if self.audio_cache:
+            self.audio_cache.close()
+        self.metadata_cache.close()
 
 
 def main(token: str) -> None:
@@ -406,13 +296,16 @@ def main(token: str) -> None:
     intents.members = False
     intents.presences = False
     
-    bot: Bot = Bot(command_prefix="/", intents=intents)
+    shard_count = int(os.getenv('SHARD_COUNT', 0)) or None
+    shard_ids = [int(shard_id) for shard_id in os.getenv('SHARD_IDS', '').split(',') if shard_id.strip()] or None
+    bot: Bot = Bot(command_prefix="/", intents=intents, shard_count=shard_count, shard_ids=shard_ids)
 
     @bot.event
     async def on_ready() -> None:
-        print(f'Logged in as {bot.user}')
+        print(f'Logged in as {bot.user} on shards {sorted(bot.shards)} of {bot.shard_count}')
         print(f'Memory-optimized mode enabled')
-        await bot.tree.sync()
+        await bot.sync_commands()
+        await bot.announce_restored_queues()
 
     @bot.event
     async def on_message(message: discord.Message) -> None:
@@ -426,22 +319,22 @@ def main(token: str) -> None:
 
     @bot.hybrid_command(name="play", description="Play a video/playlist from URL or search query")
     async def play(ctx: commands.Context, *, url: str) -> None:
+        span = metrics.Span('play')
         await ctx.defer()
 
         vc: Optional[discord.VoiceClient] = await bot.join_vc(ctx)
         if not vc:
             return
+        span.mark('voice_connected')
 
-        await bot.add_to_queue(ctx, url, vc)
+        player = await bot.get_player(ctx.guild)
+        await player.add_to_queue(ctx, url, vc, span)
 
     @bot.hybrid_command(name="stop", description="Stops the current video and clears the queue")
     async def stop(ctx: commands.Context) -> None:
-        voice: Optional[discord.VoiceClient] = await bot.join_vc(ctx)
-        if voice and (voice.is_playing() or voice.is_paused()):
-            voice.stop()
-            bot.queue.clear()
-            bot.running_queue = False
-            gc.collect()
+        player = await bot.get_player(ctx.guild)
+        if player.is_active():
+            player.stop()
             embed = discord.Embed(
                 title="⏹️ Stopped",
                 description="Playback stopped and queue cleared.",
@@ -466,25 +359,48 @@ def main(token: str) -> None:
             await ctx.send("❌ Nothing is currently playing!")
 
     @bot.hybrid_command(name="queue", description="Shows the current queue")
-    async def queue_cmd(ctx: commands.Context) -> None:
-        if bot.queue:
-            embed = discord.Embed(
-                title="📜 Queue",
-                color=discord.Color.blue()
-            )
-            
-            queue_list = '\n'.join([f"`{i+1}.` {video.get('title', 'Unknown')[:60]}" for i, video in enumerate(list(bot.queue)[:10])])
-            embed.description = queue_list
-            
-            if len(bot.queue) > 10:
-                embed.set_footer(text=f"... and {len(bot.queue) - 10} more songs")
-            else:
-                embed.set_footer(text=f"Total: {len(bot.queue)} songs")
-            
-            await ctx.send(embed=embed)
+    async def queue_cmd(ctx: commands.Context, page: int = 1) -> None:
+        player = await bot.get_player(ctx.guild)
+        if player.queue:
+            view = QueueView(player, page - 1)
+            await ctx.send(embed=view.create_embed(), view=view)
         else:
             await ctx.send("📭 The queue is empty!")
-    
+
+    @bot.hybrid_command(name="remove", description="Removes a song from the queue")
+    async def remove(ctx: commands.Context, position: int) -> None:
+        player = await bot.get_player(ctx.guild)
+        if not 1 <= position <= len(player.queue):
+            await ctx.send(f"❌ Position must be between 1 and {len(player.queue)}!")
+            return
+        track = player.remove(position - 1)
+        await ctx.send(f"🗑️ Removed `{position}.` {track.title[:80]}")
+
+    @bot.hybrid_command(name="move", description="Moves a song to another position in the queue")
+    async def move(ctx: commands.Context, position: int, destination: int) -> None:
+        player = await bot.get_player(ctx.guild)
+        size = len(player.queue)
+        if not (1 <= position <= size and 1 <= destination <= size):
+            await ctx.send(f"❌ Positions must be between 1 and {size}!")
+            return
+        track = player.move(position - 1, destination - 1)
+        await ctx.send(f"↕️ Moved {track.title[:80]} to position #{destination}")
+
+    @bot.hybrid_command(name="shuffle", description="Shuffles the queue")
+    async def shuffle(ctx: commands.Context) -> None:
+        player = await bot.get_player(ctx.guild)
+        if len(player.queue) < 2:
+            await ctx.send("❌ Not enough songs in the queue to shuffle!")
+            return
+        player.shuffle()
+        await ctx.send(f"🔀 Shuffled {len(player.queue)} songs.")
+
+    @bot.hybrid_command(name="dedupe", description="Removes duplicate songs from the queue")
+    async def dedupe(ctx: commands.Context) -> None:
+        player = await bot.get_player(ctx.guild)
+        removed = player.dedupe()
+        await ctx.send(f"🧹 Removed {removed} duplicate songs." if removed else "✅ No duplicates in the queue.")
+
     @bot.hybrid_command(name="pause", description="Pauses the current video")
     async def pause(ctx: commands.Context) -> None:
         voice: Optional[discord.VoiceClient] = await bot.join_vc(ctx)
@@ -497,6 +413,7 @@ def main(token: str) -> None:
     @bot.hybrid_command(name="resume", description="Resumes the paused video")
     async def resume(ctx: commands.Context) -> None:
         voice: Optional[discord.VoiceClient] = await bot.join_vc(ctx)
+        player = await bot.get_player(ctx.guild)
         if voice and voice.is_paused():
             voice.resume()
             embed = discord.Embed(
@@ -505,15 +422,24 @@ def main(token: str) -> None:
                 color=discord.Color.green()
             )
             await ctx.send(embed=embed)
+        elif voice and player.queue and not player.running_queue:
+            player.voice = voice
+            player.set_channel(ctx.channel)
+            player.start()
+            embed = discord.Embed(
+                title="▶️ Resumed",
+                description=f"Continuing the queue with {len(player.queue)} songs.",
+                color=discord.Color.green()
+            )
+            await ctx.send(embed=embed)
         else:
             await ctx.send("❌ Nothing is currently paused!")
     
     @bot.hybrid_command(name="clear", description="Clears the queue without stopping current song")
     async def clear_queue(ctx: commands.Context) -> None:
-        if bot.queue:
-            cleared_count = len(bot.queue)
-            bot.queue.clear()
-            gc.collect()
+        player = await bot.get_player(ctx.guild)
+        if player.queue:
+            cleared_count = player.clear()
             embed = discord.Embed(
                 title="🗑️ Queue Cleared",
                 description=f"Removed {cleared_count} songs from the queue.",
@@ -537,4 +463,5 @@ def main(token: str) -> None:
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     load_dotenv()
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
     main(os.getenv('DISCORD_TOKEN'))
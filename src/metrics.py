@@ -0,0 +1,202 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Optional, Union
+
+
+DEFAULT_BUCKETS: tuple[float, ...] = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.counts: list[int] = [0] * (len(self.buckets) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.last: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.last = value
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self.count:
+                return None
+            target = q * self.count
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if seen >= target:
+                    return bound
+            return float('inf')
+
+    def summary(self) -> str:
+        if not self.count:
+            return f"{self.name}: no samples"
+        return (f"{self.name}: count={self.count} avg={self.sum / self.count:.1f} "
+                f"p50<={self.quantile(0.5)} p95<={self.quantile(0.95)} last={self.last:.1f}")
+
+    def render(self) -> list[str]:
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            seen += bucket_count
+            lines.append(f'{self.name}_bucket{{le="{bound:g}"}} {seen}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {total:g}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, description: str, label: Optional[str] = None) -> None:
+        self.name = name
+        self.description = description
+        self.label = label
+        self.values: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def count(self) -> float:
+        return sum(self.values.values())
+
+    def inc(self, label: str = '', amount: float = 1) -> None:
+        with self._lock:
+            self.values[label] = self.values.get(label, 0) + amount
+
+    def summary(self) -> str:
+        if not self.label:
+            return f"{self.name}: {self.count:g}"
+        values = ' '.join(f"{label}={value:g}" for label, value in sorted(self.values.items()))
+        return f"{self.name}: {values}"
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self.values.items())
+        if self.label:
+            lines.extend(f'{self.name}{{{self.label}="{label}"}} {value:g}' for label, value in values)
+        else:
+            lines.append(f"{self.name} {sum(value for _, value in values):g}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, description: str, callback: Optional[Callable[[], float]] = None) -> None:
+        self.name = name
+        self.description = description
+        self.callback = callback
+        self.value: float = 0
+        self._lock = threading.Lock()
+
+    def get(self) -> float:
+        if self.callback is not None:
+            try:
+                return float(self.callback())
+            except Exception:
+                return float('nan')
+        return self.value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def summary(self) -> str:
+        return f"{self.name}: {self.get():g}"
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge", f"{self.name} {self.get():g}"]
+
+
+Metric = Union[Histogram, Counter, Gauge]
+registry: dict[str, Metric] = {}
+_registry_lock = threading.Lock()
+
+
+def _register(name: str, factory: Callable[[], Metric]) -> Metric:
+    with _registry_lock:
+        metric = registry.get(name)
+        if metric is None:
+            metric = factory()
+            registry[name] = metric
+        return metric
+
+
+def histogram(name: str, description: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(name, lambda: Histogram(name, description, buckets))
+
+
+def counter(name: str, description: str, label: Optional[str] = None) -> Counter:
+    return _register(name, lambda: Counter(name, description, label))
+
+
+def gauge(name: str, description: str, callback: Optional[Callable[[], float]] = None) -> Gauge:
+    metric = _register(name, lambda: Gauge(name, description, callback))
+    if callback is not None:
+        metric.callback = callback
+    return metric
+
+
+def log_summary(logger: logging.Logger) -> None:
+    for metric in list(registry.values()):
+        if isinstance(metric, Gauge) or metric.count:
+            logger.info(metric.summary())
+
+
+def render() -> str:
+    lines = []
+    for metric in list(registry.values()):
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+async def start_server(host: str, port: int):
+    from aiohttp import web
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+class Span:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.started_at = time.perf_counter()
+        self._marked: set[str] = set()
+
+    def mark(self, stage: str) -> None:
+        if stage in self._marked:
+            return
+        self._marked.add(stage)
+        elapsed = (time.perf_counter() - self.started_at) * 1000
+        histogram(f"{self.name}_{stage}_ms", f"Time from command received to {stage.replace('_', ' ')}").observe(elapsed)
+
+
+INTER_TRACK_GAP_MS = histogram('inter_track_gap_ms', 'Silence between the end of one track and the first frame of the next')
+EXTRACTION_MS = histogram('extraction_ms', 'Time spent in a single yt-dlp extraction')
+FFMPEG_SPAWN_MS = histogram('ffmpeg_spawn_ms', 'Time to spawn ffmpeg and buffer the first frames of a track')
+EXTRACTION_ERRORS = counter('extraction_errors_total', 'Failed extractions by error class', label='error')
+EXTRACTION_COALESCED = counter('extraction_coalesced_total', 'Extraction requests that joined an identical job already running')
+UPDATES_DROPPED = counter('channel_updates_dropped_total', 'Message updates superseded by a newer one or notices over the limit',
+                          label='kind')
+ACTIVE_FFMPEG = gauge('active_ffmpeg_processes', 'ffmpeg processes currently streaming or caching audio')
@@ -0,0 +1,579 @@
+import asyncio
+import contextlib
+import itertools
+import logging
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Optional
+import discord
+from discord.ext import commands
+
+import metrics
+
+from extraction import Priority, is_playlist_url, normalize_url, video_key
+from sources import OggFileSource, PrebufferedSource, create_ffmpeg_source
+from supervisor import CapacityError
+from track import Track, TrackQueue
+from updates import ChannelUpdater
+from views import MusicControlView
+
+if TYPE_CHECKING:
+    from journal import GuildJournal
+
+
+PREBUFFER_LEAD = 20
+PREBUFFER_FRAMES = 25
+UNAVAILABLE_TITLES = ('[Private video]', '[Deleted video]')
+
+
+async def listing_pages(info: dict) -> AsyncIterator[tuple[str, Any]]:
+    yield 'playlist', {'title': info.get('title'), 'webpage_url': info.get('webpage_url')}
+    yield 'entries', info['entries']
+
+
+class GuildPlayer:
+    def __init__(self, bot, guild_id: int) -> None:
+        self.bot = bot
+        self.guild_id = guild_id
+        self.queue = TrackQueue(bot.max_queue_length, bot.max_queue_bytes)
+        self.running_queue: bool = False
+        self.voice: Optional[discord.VoiceClient] = None
+        self.channel: Optional[discord.abc.Messageable] = None
+        self.updater: Optional[ChannelUpdater] = None
+        self.controls: Optional[MusicControlView] = None
+        self.last_active: float = time.monotonic()
+        self.alone_since: Optional[float] = None
+        self.logger = logging.getLogger('discord.bot.player')
+        self._task: Optional[asyncio.Task] = None
+        self._resolving: dict[str, asyncio.Task] = {}
+        self._prepared: Optional[tuple[Track, PrebufferedSource]] = None
+        self._last_track_ended: Optional[float] = None
+        self._start_span: Optional[metrics.Span] = None
+        self._generation = 0
+
+    def is_active(self) -> bool:
+        return bool(self.voice and (self.voice.is_playing() or self.voice.is_paused()))
+
+    def is_idle(self, timeout: float) -> bool:
+        if self.running_queue or self.is_active():
+            return False
+        return time.monotonic() - self.last_active >= timeout
+
+    def is_alone(self, timeout: float) -> bool:
+        return self.alone_since is not None and time.monotonic() - self.alone_since >= timeout
+
+    def update_listeners(self, channel: Optional[discord.VoiceChannel]) -> None:
+        if channel is None or any(not member.bot for member in channel.members):
+            self.alone_since = None
+        elif self.alone_since is None:
+            self.alone_since = time.monotonic()
+
+    def touch(self) -> None:
+        self.last_active = time.monotonic()
+
+    def start(self, span: Optional[metrics.Span] = None) -> None:
+        if self.running_queue or not self.queue:
+            return
+        self.running_queue = True
+        self._start_span = span
+        self._task = asyncio.create_task(self._playback_loop(), name=f'player:{self.guild_id}')
+
+    def clear(self) -> int:
+        self._generation += 1
+        cleared_count = len(self.queue)
+        self.queue.clear()
+        self.discard_prepared()
+        return cleared_count
+
+    def queue_changed(self) -> None:
+        if self._prepared and (not self.queue or self.queue[0] is not self._prepared[0]):
+            self.discard_prepared()
+        if self.running_queue:
+            self.prefetch()
+
+    def remove(self, index: int) -> Track:
+        track = self.queue.remove(index)
+        self.queue_changed()
+        return track
+
+    def move(self, source: int, destination: int) -> Track:
+        track = self.queue.move(source, destination)
+        self.queue_changed()
+        return track
+
+    def shuffle(self) -> None:
+        self.queue.shuffle()
+        self.queue_changed()
+
+    def dedupe(self) -> int:
+        removed = self.queue.dedupe()
+        self.queue_changed()
+        return removed
+
+    def stop(self) -> None:
+        self.clear()
+        for task in self._resolving.values():
+            task.cancel()
+        self._resolving.clear()
+        self.bot.extraction.cancel_guild(self.guild_id)
+        if self.is_active():
+            self.voice.stop()
+        self.touch()
+
+    async def teardown(self, notice: Optional[str] = None) -> None:
+        if notice and self.queue and self.queue.journal:
+            notice += " The queue was saved, use /resume to pick it back up."
+        self.queue.journal = None
+        self.stop()
+        if self._task:
+            self._task.cancel()
+        if self.controls:
+            self.controls.stop()
+            self.controls = None
+        if notice and self.updater:
+            self.updater.notify(notice)
+        voice, self.voice = self.voice, None
+        if voice and voice.is_connected():
+            try:
+                await voice.disconnect()
+            except Exception as e:
+                self.logger.warning(f"Failed to disconnect from voice in guild {self.guild_id}: {e}")
+        if self.updater:
+            await self.updater.drain()
+
+    async def _playback_loop(self) -> None:
+        self._last_track_ended = None
+        span, self._start_span = self._start_span, None
+        try:
+            while self.queue and self.voice and self.voice.is_connected():
+                video_info = self.queue.popleft()
+                source = self.take_prepared(video_info) or self.open_cached(video_info)
+                if source is None:
+                    error = await self.resolve(video_info)
+                    self.prefetch()
+                    if error:
+                        self.report_skipped(video_info, error)
+                        continue
+                    try:
+                        source = await self.prepare_source(video_info, span)
+                    except CapacityError as e:
+                        self.logger.warning(f"Cannot start playback in guild {self.guild_id}: {e}")
+                        self.queue.appendleft(video_info)
+                        self.updater.notify("⏳ Too many songs are streaming right now, use /resume in a moment to continue the queue.")
+                        break
+                    if source is None:
+                        self.updater.notify(f"❌ Failed to play: {video_info.title}")
+                        continue
+                else:
+                    self.prefetch()
+                source.handoff_from = self._last_track_ended
+                source.span, span = span, None
+                finished = asyncio.Event()
+                if self.play_video(video_info, source, finished):
+                    if self.bot.audio_cache and video_info.url and not isinstance(source.source, OggFileSource):
+                        self.bot.audio_cache.record_play(video_key(video_info.webpage_url), video_info.url,
+                                                         video_info.acodec, video_info.duration)
+                    await self._wait_and_prebuffer(video_info, finished)
+                    if source.stalled:
+                        self.updater.notify(f"⚠️ {video_info.title[:80]} stopped streaming, skipping to the next song.")
+                self.touch()
+            self.queue.settle()
+        except Exception as e:
+            self.logger.error(f"Playback loop crashed in guild {self.guild_id}: {e}")
+        finally:
+            self.discard_prepared()
+            self.running_queue = False
+            self._task = None
+            self.touch()
+
+    async def _wait_and_prebuffer(self, video_info: Track, finished: asyncio.Event) -> None:
+        lead_time = max(0, video_info.duration - PREBUFFER_LEAD)
+        try:
+            await asyncio.wait_for(finished.wait(), timeout=lead_time)
+            return
+        except asyncio.TimeoutError:
+            pass
+        await self.prepare_next()
+        await finished.wait()
+
+    def is_cached(self, video_info: Track) -> bool:
+        return bool(self.bot.audio_cache) and video_key(video_info.webpage_url) in self.bot.audio_cache
+
+    def open_cached(self, video_info: Track) -> Optional[PrebufferedSource]:
+        if not self.bot.audio_cache:
+            return None
+        path = self.bot.audio_cache.lookup(video_key(video_info.webpage_url))
+        if path is None:
+            return None
+        try:
+            return PrebufferedSource(OggFileSource(path))
+        except OSError as e:
+            self.logger.warning(f"Failed to open cached audio {path}: {e}")
+            return None
+
+    async def prepare_source(self, video_info: Track, span: Optional[metrics.Span] = None,
+                             wait: bool = True) -> Optional[PrebufferedSource]:
+        started_at = time.perf_counter()
+        try:
+            source = await self.bot.ffmpeg.spawn(lambda: create_ffmpeg_source(video_info.url, video_info.acodec), wait=wait)
+        except discord.ClientException as e:
+            self.logger.error(f"Discord client error: {e}")
+            return None
+        if source is None:
+            return None
+        source.is_held = lambda: self.holds(source)
+        if span is not None:
+            span.mark('ffmpeg_spawned')
+        try:
+            if not await asyncio.to_thread(source.prefill, PREBUFFER_FRAMES):
+                raise RuntimeError("no audio frames received")
+        except Exception as e:
+            self.logger.error(f"Failed to prebuffer {video_info.webpage_url}: {e}")
+            source.cleanup()
+            return None
+        metrics.FFMPEG_SPAWN_MS.observe((time.perf_counter() - started_at) * 1000)
+        return source
+
+    async def prepare_next(self) -> None:
+        while self.queue and not self._prepared:
+            video_info = self.queue[0]
+            source = self.open_cached(video_info)
+            if source is not None:
+                self._prepared = (video_info, source)
+                return
+            error = await self.resolve(video_info)
+            if not error:
+                break
+            if self.queue and self.queue[0] is video_info:
+                self.queue.popleft()
+                self.report_skipped(video_info, error)
+        else:
+            return
+        source = await self.prepare_source(video_info, wait=False)
+        if source is None:
+            return
+        if self._prepared or not self.queue or self.queue[0] is not video_info:
+            source.cleanup()
+            return
+        self._prepared = (video_info, source)
+
+    def take_prepared(self, video_info: Track) -> Optional[PrebufferedSource]:
+        if self._prepared is None:
+            return None
+        prepared_info, source = self._prepared
+        self._prepared = None
+        if prepared_info is video_info:
+            return source
+        source.cleanup()
+        return None
+
+    def holds(self, source: PrebufferedSource) -> bool:
+        if self._prepared is not None and self._prepared[1] is source:
+            return True
+        return self.voice is not None and self.voice.is_connected() and getattr(self.voice, 'source', None) is source
+
+    def discard_prepared(self) -> None:
+        if self._prepared:
+            self._prepared[1].cleanup()
+            self._prepared = None
+
+    async def _resolve_entry(self, webpage_url: str, priority: Priority) -> tuple[Optional[Track], Optional[str]]:
+        info, error = await self.bot.extract_info(webpage_url, extract_flat=False, priority=priority, guild_id=self.guild_id)
+        if not info or 'url' not in info:
+            return None, error or "unavailable"
+        return Track.from_info(info, resolved=True), None
+
+    def _resolve_task(self, entry: Track, priority: Priority) -> asyncio.Task:
+        key = entry.webpage_url
+        task = self._resolving.get(key)
+        if task is None:
+            task = asyncio.create_task(self._resolve_entry(key, priority))
+            self._resolving[key] = task
+            task.add_done_callback(lambda _: self._resolving.pop(key, None))
+        return task
+
+    async def resolve(self, entry: Track, priority: Priority = Priority.NOW_PLAYING) -> Optional[str]:
+        if entry.is_resolved():
+            return None
+        task = self._resolve_task(entry, priority)
+        try:
+            resolved, error = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return "cancelled"
+            raise
+        except Exception as e:
+            self.logger.warning(f"Failed to resolve {entry.webpage_url}: {e}")
+            return "unknown_error"
+        if resolved:
+            entry.update(resolved)
+        return error
+
+    def prefetch(self) -> None:
+        for index, entry in enumerate(itertools.islice(self.queue, self.bot.resolve_lookahead)):
+            if not entry.is_resolved() and not self.is_cached(entry):
+                self._resolve_task(entry, Priority.NOW_PLAYING if index == 0 else Priority.BACKFILL)
+
+    def report_skipped(self, entry: Track, error: str) -> None:
+        if error == "cancelled":
+            return
+        self.logger.warning(f"Skipped {entry.webpage_url} ({error})")
+        if error == "age_restricted":
+            message = f"🔞 Skipped age-restricted video: {entry.title[:80]}"
+        elif error == "bot_check":
+            message = f"⏳ Skipped {entry.title[:80]}, YouTube is blocking the bot for now."
+        else:
+            message = f"⚠️ Skipped unavailable video: {entry.title[:80]}"
+        self.updater.notify(message)
+
+    def create_now_playing_embed(self, video_info: Track) -> discord.Embed:
+        title = video_info.title
+        if len(title) > 100:
+            title = title[:97] + "..."
+
+        embed = discord.Embed(
+            title="🎵 Now Playing",
+            description=f"**[{title}]({video_info.webpage_url})**",
+            color=discord.Color.green()
+        )
+
+        thumbnail = video_info.thumbnail
+        if thumbnail:
+            embed.set_thumbnail(url=thumbnail)
+
+        uploader = video_info.uploader
+        if uploader:
+            if len(uploader) > 50:
+                uploader = uploader[:47] + "..."
+            embed.add_field(name="Channel", value=uploader, inline=True)
+
+        duration = video_info.duration
+        if duration:
+            minutes, seconds = divmod(duration, 60)
+            hours, minutes = divmod(minutes, 60)
+            duration_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+            embed.add_field(name="Duration", value=duration_str, inline=True)
+
+        embed.set_footer(text=f"Queue: {len(self.queue)} songs")
+
+        return embed
+
+    def play_video(self, video_info: Track, source: PrebufferedSource, finished: asyncio.Event) -> bool:
+        voice = self.voice
+        if voice.is_playing():
+            self.logger.warning(f"Already playing audio, cannot start: {video_info.title}")
+            source.cleanup()
+            return False
+
+        if voice.is_paused():
+            voice.stop()
+
+        loop = asyncio.get_running_loop()
+
+        def after(e: Optional[Exception]) -> None:
+            self._last_track_ended = time.perf_counter()
+            if e:
+                self.logger.error(f'Player error: {e}')
+
+            loop.call_soon_threadsafe(finished.set)
+
+        try:
+            voice.play(source, after=after)
+        except discord.ClientException as e:
+            self.logger.error(f"Discord client error: {e}")
+            source.cleanup()
+            self.updater.notify(f"❌ Audio player error: {str(e)}")
+            self.queue.clear()
+            return False
+
+        if self.controls is None:
+            self.controls = MusicControlView(self.bot)
+        self.updater.update('player', embed=self.create_now_playing_embed(video_info), view=self.controls)
+        return True
+
+    def set_channel(self, channel: discord.abc.Messageable) -> None:
+        if self.channel is not channel or self.updater is None:
+            self.channel = channel
+            self.updater = ChannelUpdater(channel)
+        if self.queue.journal:
+            self.queue.journal.set_channel(channel.id)
+
+    def restore(self, journal: 'GuildJournal', tracks: list[Track]) -> None:
+        self.queue.restore(tracks)
+        self.queue.journal = journal
+        if tracks:
+            self.logger.info(f"Restored {len(tracks)} queued songs for guild {self.guild_id}")
+
+    async def add_to_queue(self, ctx: commands.Context, url: str, voice: discord.VoiceClient,
+                           span: Optional[metrics.Span] = None) -> None:
+        self.voice = voice
+        self.set_channel(ctx.channel)
+        self.touch()
+        loading_msg = await ctx.send("🔍 Fetching video information...")
+
+        if is_playlist_url(normalize_url(url, extract_flat=True)):
+            await self.ingest_playlist(loading_msg, self.bot.stream_playlist(url), span)
+            return
+
+        info, error = await self.bot.extract_info(url, extract_flat=True, guild_id=self.guild_id)
+
+        if not info:
+            if error == "age_restricted":
+                await loading_msg.edit(content=f'🔞 This video is age-restricted or requires sign-in. The bot cannot play it without authentication.')
+            elif error == "unavailable":
+                await loading_msg.edit(content=f'❌ This video is unavailable, private, or has been removed.')
+            elif error == "bot_check":
+                await loading_msg.edit(content='⏳ YouTube is asking the bot to confirm it is not a bot. Try again in a few minutes.')
+            else:
+                await loading_msg.edit(content=f'❌ URL not supported or couldn\'t fetch info, {ctx.author.mention}!')
+            return
+
+        if 'entries' not in info:
+            if 'url' not in info:
+                info, error = await self.bot.extract_info(url, extract_flat=False, guild_id=self.guild_id)
+
+            if info and 'url' in info:
+                track = Track.from_info(info, resolved=True)
+                if span is not None:
+                    span.mark('metadata_resolved')
+                saved_ahead = 0 if self.running_queue else len(self.queue)
+                if not self.queue.append(track):
+                    await loading_msg.edit(content=f"❌ The queue is full ({len(self.queue)} songs)!")
+                    return
+
+                if self.running_queue or saved_ahead:
+                    embed = discord.Embed(
+                        title="✅ Added to Queue",
+                        description=f"**[{track.title}]({track.webpage_url})**",
+                        color=discord.Color.green()
+                    )
+                    if track.thumbnail:
+                        embed.set_thumbnail(url=track.thumbnail)
+                    embed.add_field(name="Position", value=f"#{len(self.queue)}", inline=True)
+                    if track.duration:
+                        minutes, seconds = divmod(track.duration, 60)
+                        embed.add_field(name="Duration", value=f"{minutes:02d}:{seconds:02d}", inline=True)
+                    if saved_ahead:
+                        embed.add_field(name="Saved Queue",
+                                        value=f"⏮️ Playing {saved_ahead} songs saved before this one first", inline=False)
+                    await loading_msg.edit(content=None, embed=embed)
+                    if not self.running_queue:
+                        self.start(span)
+                else:
+                    await loading_msg.delete()
+                    self.start(span)
+            else:
+                if error == "age_restricted":
+                    await loading_msg.edit(content='🔞 This video is age-restricted. The bot cannot play it without YouTube account authentication.')
+                elif error == "unavailable":
+                    await loading_msg.edit(content='❌ This video is unavailable, private, or has been removed.')
+                elif error == "bot_check":
+                    await loading_msg.edit(content='⏳ YouTube is asking the bot to confirm it is not a bot. Try again in a few minutes.')
+                else:
+                    await loading_msg.edit(content="❌ Couldn't fetch video info!")
+            return
+
+        await self.ingest_playlist(loading_msg, listing_pages(info), span)
+
+    async def ingest_playlist(self, loading_msg: discord.Message, pages: AsyncIterator[tuple[str, Any]],
+                              span: Optional[metrics.Span] = None) -> None:
+        generation = self._generation
+        saved_ahead = 0 if self.running_queue else len(self.queue)
+        playlist_title = 'Unknown Playlist'
+        added_count = 0
+        skipped_count = 0
+        age_restricted_count = 0
+        queue_full = False
+        error = None
+        progress_key = ('loading', loading_msg.id)
+
+        async with contextlib.aclosing(pages):
+            async for kind, payload in pages:
+                if generation != self._generation:
+                    self.logger.info(f"Playlist import cancelled in guild {self.guild_id}")
+                    return
+                if kind == 'playlist':
+                    playlist_title = payload.get('title') or playlist_title
+                    continue
+                if kind == 'error':
+                    error = payload
+                    continue
+
+                for entry in payload:
+                    if not entry or not (entry.get('url') or entry.get('id')) or entry.get('title') in UNAVAILABLE_TITLES:
+                        skipped_count += 1
+                        continue
+                    track = Track.from_info(entry)
+                    entry_error = self.bot.negative_cache.get(video_key(track.webpage_url))
+                    if entry_error == "age_restricted":
+                        age_restricted_count += 1
+                        continue
+                    elif entry_error:
+                        skipped_count += 1
+                        continue
+                    if not self.queue.append(track):
+                        queue_full = True
+                        break
+                    added_count += 1
+
+                if span is not None and added_count:
+                    span.mark('metadata_resolved')
+                if self.running_queue:
+                    self.prefetch()
+                else:
+                    self.start(span)
+
+                if queue_full:
+                    self.logger.info(f"Queue limit reached in guild {self.guild_id}, stopping playlist import")
+                    break
+
+                status = f"**{playlist_title}**\nAdded {added_count} videos so far..."
+                if skipped_count > 0:
+                    status += f"\n⚠️ Skipped {skipped_count} (unavailable/private)"
+                if age_restricted_count > 0:
+                    status += f"\n🔞 Skipped {age_restricted_count} (age-restricted)"
+                embed = discord.Embed(title="📋 Loading Playlist", description=status, color=discord.Color.blue())
+                self.updater.update(progress_key, message=loading_msg, content=None, embed=embed)
+
+        if added_count == 0:
+            if error == "age_restricted":
+                error_msg = '🔞 This playlist is age-restricted or requires sign-in.'
+            elif error == "unavailable":
+                error_msg = '❌ This playlist is unavailable, private, or has been removed.'
+            elif error == "bot_check":
+                error_msg = '⏳ YouTube is asking the bot to confirm it is not a bot. Try again in a few minutes.'
+            elif queue_full:
+                error_msg = f"❌ The queue is full ({len(self.queue)} songs)!"
+            elif error:
+                error_msg = "❌ Couldn't fetch the playlist!"
+            else:
+                error_msg = "❌ No valid videos could be added!"
+            if age_restricted_count > 0:
+                error_msg += f"\n🔞 {age_restricted_count} videos were age-restricted (bot needs YouTube account)"
+            if skipped_count > 0:
+                error_msg += f"\n⚠️ {skipped_count} videos were unavailable/private"
+            self.updater.update(progress_key, message=loading_msg, final=True, content=error_msg, embed=None)
+            return
+
+        embed = discord.Embed(
+            title="✅ Playlist Added",
+            description=f"**{playlist_title}**\nSuccessfully added {added_count} videos!",
+            color=discord.Color.green()
+        )
+
+        if skipped_count > 0 or age_restricted_count > 0:
+            warnings = []
+            if skipped_count > 0:
+                warnings.append(f"⚠️ {skipped_count} unavailable/private")
+            if age_restricted_count > 0:
+                warnings.append(f"🔞 {age_restricted_count} age-restricted")
+            embed.add_field(name="Skipped", value=" | ".join(warnings), inline=False)
+        if queue_full:
+            embed.add_field(name="Incomplete", value="⚠️ The queue is full, the rest of the playlist was not added", inline=False)
+        elif error:
+            embed.add_field(name="Incomplete", value="⚠️ The rest of the playlist could not be fetched", inline=False)
+
+        if saved_ahead:
+            embed.add_field(name="Saved Queue", value=f"⏮️ Playing {saved_ahead} songs saved before this playlist first",
+                            inline=False)
+        embed.add_field(name="Queue Size", value=f"{len(self.queue)} songs", inline=True)
+        self.updater.update(progress_key, message=loading_msg, final=True, content=None, embed=embed)
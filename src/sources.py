@@ -0,0 +1,124 @@
+import time
+from collections import deque
+from typing import Callable, Optional
+from urllib.parse import parse_qs, urlparse
+import discord
+from discord.oggparse import OggStream
+
+import metrics
+
+
+FFMPEG_BEFORE_OPTIONS = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -probesize 1M -analyzeduration 0'
+FFMPEG_OPTIONS = '-vn'
+TRANSCODE_BITRATE = 128
+YTDL_FORMAT = 'bestaudio[acodec=opus]/bestaudio/best'
+STREAM_URL_TTL = 3 * 60 * 60
+STREAM_URL_EXPIRY_MARGIN = 5 * 60
+
+
+def is_opus_format(fmt: dict) -> bool:
+    return fmt.get('acodec') == 'opus' and fmt.get('ext') in ('webm', 'opus', 'ogg')
+
+
+def select_audio_format(info: dict) -> Optional[dict]:
+    formats = [fmt for fmt in info.get('formats') or () if fmt.get('url') and fmt.get('acodec') not in (None, 'none')]
+    opus_formats = [fmt for fmt in formats
+                    if is_opus_format(fmt) and fmt.get('vcodec') in (None, 'none') and fmt.get('protocol', 'https') in ('http', 'https')]
+    if opus_formats:
+        return max(opus_formats, key=lambda fmt: fmt.get('abr') or fmt.get('tbr') or 0)
+    if info.get('url'):
+        return info
+    return None
+
+
+def stream_expires_at(stream_url: str, resolved_at: float) -> float:
+    expire = parse_qs(urlparse(stream_url).query).get('expire')
+    if expire and expire[0].isdigit():
+        return float(expire[0]) - STREAM_URL_EXPIRY_MARGIN
+    return resolved_at + STREAM_URL_TTL
+
+
+def create_ffmpeg_source(stream_url: str, acodec: Optional[str] = None) -> discord.FFmpegOpusAudio:
+    if acodec == 'opus':
+        return discord.FFmpegOpusAudio(stream_url, codec='copy', before_options=FFMPEG_BEFORE_OPTIONS, options=FFMPEG_OPTIONS)
+    return discord.FFmpegOpusAudio(stream_url, bitrate=TRANSCODE_BITRATE, before_options=FFMPEG_BEFORE_OPTIONS, options=FFMPEG_OPTIONS)
+
+
+class PrebufferedSource(discord.AudioSource):
+    def __init__(self, source: discord.AudioSource) -> None:
+        self.source = source
+        self.handoff_from: Optional[float] = None
+        self.first_frame_at: Optional[float] = None
+        self.span: Optional[metrics.Span] = None
+        self.on_cleanup: Optional[Callable[[], None]] = None
+        self.is_held: Optional[Callable[[], bool]] = None
+        self.last_read_at = time.monotonic()
+        self.reading_since: Optional[float] = None
+        self.stalled = False
+        self._buffer: deque[bytes] = deque()
+        self._closed = False
+        self._spawned = isinstance(source, discord.FFmpegAudio)
+        if self._spawned:
+            metrics.ACTIVE_FFMPEG.inc()
+
+    def _read_source(self) -> bytes:
+        self.reading_since = time.monotonic()
+        try:
+            return self.source.read()
+        finally:
+            self.reading_since = None
+            self.last_read_at = time.monotonic()
+
+    def prefill(self, frames: int) -> int:
+        while len(self._buffer) < frames:
+            data = self._read_source()
+            if not data:
+                break
+            self._buffer.append(data)
+        return len(self._buffer)
+
+    def read(self) -> bytes:
+        if self.first_frame_at is None:
+            self.first_frame_at = time.perf_counter()
+            if self.handoff_from is not None:
+                metrics.INTER_TRACK_GAP_MS.observe((self.first_frame_at - self.handoff_from) * 1000)
+            if self.span is not None:
+                self.span.mark('first_frame')
+        self.last_read_at = time.monotonic()
+        if self._buffer:
+            return self._buffer.popleft()
+        return self._read_source()
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._buffer.clear()
+        self.source.cleanup()
+        if self._spawned:
+            metrics.ACTIVE_FFMPEG.dec()
+        if self.on_cleanup is not None:
+            self.on_cleanup()
+
+
+class OggFileSource(discord.AudioSource):
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, 'rb')
+        self._packets = OggStream(self._file).iter_packets()
+
+    def read(self) -> bytes:
+        for packet in self._packets:
+            if packet.startswith((b'OpusHead', b'OpusTags')):
+                continue
+            return packet
+        return b''
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self) -> None:
+        self._file.close()
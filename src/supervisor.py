@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import os
+import subprocess
+import threading
+import time
+from typing import Callable, Optional
+import discord
+
+import metrics
+from sources import PrebufferedSource
+
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+FFMPEG_KILLED = metrics.counter('ffmpeg_killed_total', 'ffmpeg processes killed by the supervisor', label='reason')
+FFMPEG_REJECTED = metrics.counter('ffmpeg_rejected_total', 'Streams refused because every ffmpeg slot was busy')
+
+
+class CapacityError(Exception):
+    pass
+
+
+class ProcessStats:
+    __slots__ = ('pid', 'started_at', 'cpu_ticks', 'sampled_at', 'cpu_percent', 'rss')
+
+    def __init__(self, pid: int) -> None:
+        self.pid = pid
+        self.started_at = time.monotonic()
+        self.cpu_ticks: Optional[int] = None
+        self.sampled_at = self.started_at
+        self.cpu_percent = 0.0
+        self.rss = 0
+
+    def sample(self) -> bool:
+        try:
+            with open(f'/proc/{self.pid}/stat') as stat:
+                fields = stat.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{self.pid}/statm') as statm:
+                self.rss = int(statm.read().split()[1]) * PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            return False
+        ticks = int(fields[11]) + int(fields[12])
+        now = time.monotonic()
+        if self.cpu_ticks is not None and now > self.sampled_at:
+            self.cpu_percent = (ticks - self.cpu_ticks) / CLOCK_TICKS / (now - self.sampled_at) * 100
+        self.cpu_ticks = ticks
+        self.sampled_at = now
+        return True
+
+
+class FFmpegSupervisor:
+    def __init__(self, max_processes: int = 32, niceness: int = 5, stall_timeout: float = 20,
+                 idle_timeout: float = 900, admission_timeout: float = 10) -> None:
+        self.max_processes = max_processes
+        self.niceness = niceness
+        self.stall_timeout = stall_timeout
+        self.idle_timeout = idle_timeout
+        self.admission_timeout = admission_timeout
+        self.logger = logging.getLogger('discord.bot.supervisor')
+        self._slots = asyncio.Semaphore(max_processes)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._processes: dict[PrebufferedSource, ProcessStats] = {}
+        metrics.gauge('ffmpeg_processes', 'ffmpeg processes owned by the supervisor', lambda: len(self._processes))
+        metrics.gauge('ffmpeg_rss_bytes', 'Resident memory of all supervised ffmpeg processes',
+                      lambda: sum(stats.rss for stats in list(self._processes.values())))
+        metrics.gauge('ffmpeg_cpu_percent', 'CPU usage of all supervised ffmpeg processes',
+                      lambda: sum(stats.cpu_percent for stats in list(self._processes.values())))
+
+    def __len__(self) -> int:
+        return len(self._processes)
+
+    async def spawn(self, factory: Callable[[], discord.AudioSource], wait: bool = True) -> Optional[PrebufferedSource]:
+        self._loop = asyncio.get_running_loop()
+        if not wait:
+            if self._slots.locked():
+                return None
+            await self._slots.acquire()
+        else:
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.admission_timeout)
+            except asyncio.TimeoutError:
+                FFMPEG_REJECTED.inc()
+                raise CapacityError(f"all {self.max_processes} ffmpeg slots are busy") from None
+        try:
+            source = PrebufferedSource(factory())
+        except BaseException:
+            self._slots.release()
+            raise
+        process = getattr(source.source, '_process', None)
+        if not isinstance(process, subprocess.Popen):
+            source.on_cleanup = lambda: self._loop.call_soon_threadsafe(self._slots.release)
+            return source
+        self._renice(process.pid)
+        with self._lock:
+            self._processes[source] = ProcessStats(process.pid)
+        source.on_cleanup = lambda: self._release(source)
+        return source
+
+    def _renice(self, pid: int) -> None:
+        if not self.niceness:
+            return
+        try:
+            os.setpriority(os.PRIO_PROCESS, pid, self.niceness)
+        except (AttributeError, OSError) as e:
+            self.logger.debug(f"Could not renice ffmpeg {pid}: {e}")
+
+    def _release(self, source: PrebufferedSource) -> None:
+        with self._lock:
+            self._processes.pop(source, None)
+        self._loop.call_soon_threadsafe(self._slots.release)
+
+    def _kill(self, source: PrebufferedSource, reason: str) -> None:
+        process = getattr(source.source, '_process', None)
+        if not isinstance(process, subprocess.Popen) or process.poll() is not None:
+            return
+        FFMPEG_KILLED.inc(reason)
+        source.stalled = reason == 'stalled'
+        try:
+            process.kill()
+        except OSError:
+            pass
+
+    def check(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            supervised = list(self._processes.items())
+        for source, stats in supervised:
+            stats.sample()
+            reading_since = source.reading_since
+            if reading_since is not None and now - reading_since > self.stall_timeout:
+                self.logger.warning(f"ffmpeg {stats.pid} produced no audio for {now - reading_since:.0f}s, killing it")
+                self._kill(source, 'stalled')
+            elif reading_since is None and now - source.last_read_at > self.idle_timeout:
+                if source.is_held and source.is_held():
+                    continue
+                self.logger.warning(f"ffmpeg {stats.pid} has not been read for {now - source.last_read_at:.0f}s, "
+                                    f"reaping it")
+                self._kill(source, 'orphaned')
+                source.cleanup()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            supervised = list(self._processes)
+        for source in supervised:
+            self._kill(source, 'shutdown')
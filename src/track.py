@@ -0,0 +1,201 @@
+import itertools
+import random
+import sys
+import time
+from typing import TYPE_CHECKING, Iterator, Optional
+
+from sources import is_opus_format, select_audio_format, stream_expires_at
+
+if TYPE_CHECKING:
+    from journal import GuildJournal
+
+
+class Track:
+    __slots__ = ('url', 'title', 'webpage_url', 'thumbnail', 'uploader', 'duration', 'acodec', 'expires_at', 'nbytes')
+
+    def __init__(self, webpage_url: str, title: str = 'Unknown', thumbnail: str = '', uploader: str = '',
+                 duration: int = 0, url: Optional[str] = None, acodec: str = '', expires_at: float = 0.0) -> None:
+        self.url = url
+        self.title = title
+        self.webpage_url = webpage_url
+        self.thumbnail = thumbnail
+        self.uploader = sys.intern(uploader)
+        self.duration = duration
+        self.acodec = sys.intern(acodec)
+        self.expires_at = expires_at
+        self.nbytes = sys.getsizeof(self) + sys.getsizeof(title) + sys.getsizeof(webpage_url) + sys.getsizeof(thumbnail)
+
+    @classmethod
+    def from_info(cls, info: dict, resolved: bool = False) -> 'Track':
+        if resolved:
+            webpage_url = info.get('webpage_url', '')
+            fmt = select_audio_format(info) or {}
+            stream_url = fmt.get('url')
+            acodec = 'opus' if is_opus_format(fmt) else fmt.get('acodec')
+        else:
+            webpage_url = info.get('url') or f"https://www.youtube.com/watch?v={info['id']}"
+            stream_url, acodec = None, None
+        thumbnail = info.get('thumbnail')
+        if not thumbnail and info.get('thumbnails'):
+            thumbnail = info['thumbnails'][-1].get('url')
+        return cls(
+            webpage_url,
+            title=info.get('title') or 'Unknown',
+            thumbnail=thumbnail or '',
+            uploader=info.get('uploader') or info.get('channel') or '',
+            duration=int(info.get('duration') or 0),
+            url=stream_url,
+            acodec=acodec or '',
+            expires_at=(info.get('stream_expires_at') or stream_expires_at(stream_url, time.time())) if stream_url else 0.0
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Track':
+        return cls(**data)
+
+    def to_dict(self) -> dict:
+        data = {'webpage_url': self.webpage_url, 'title': self.title, 'thumbnail': self.thumbnail,
+                'uploader': self.uploader, 'duration': self.duration}
+        if self.is_resolved():
+            data.update(url=self.url, acodec=self.acodec, expires_at=self.expires_at)
+        return data
+
+    def update(self, other: 'Track') -> None:
+        self.url = other.url
+        self.acodec = other.acodec
+        self.expires_at = other.expires_at
+        self.title = other.title if other.title != 'Unknown' else self.title
+        self.thumbnail = other.thumbnail or self.thumbnail
+        self.uploader = other.uploader or self.uploader
+        self.duration = other.duration or self.duration
+
+    def is_resolved(self) -> bool:
+        return bool(self.url) and self.expires_at > time.time()
+
+
+class TrackQueue:
+    def __init__(self, max_length: int = 0, max_bytes: int = 0) -> None:
+        self.max_length = max_length
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.journal: Optional['GuildJournal'] = None
+        self._tracks: list[Optional[Track]] = []
+        self._head = 0
+
+    def _compact(self) -> None:
+        if self._head > 64 and self._head * 2 > len(self._tracks):
+            del self._tracks[:self._head]
+            self._head = 0
+
+    def _index(self, index: int) -> int:
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError('queue index out of range')
+        return self._head + index
+
+    def has_room(self, track: Track) -> bool:
+        if self.max_length and len(self) >= self.max_length:
+            return False
+        return not self.max_bytes or self.nbytes + track.nbytes <= self.max_bytes
+
+    def append(self, track: Track) -> bool:
+        if not self.has_room(track):
+            return False
+        self._tracks.append(track)
+        self.nbytes += track.nbytes
+        if self.journal:
+            self.journal.append(track)
+        return True
+
+    def restore(self, tracks: list[Track]) -> None:
+        self._tracks = list(tracks)
+        self._head = 0
+        self.nbytes = sum(track.nbytes for track in tracks)
+
+    def appendleft(self, track: Track) -> None:
+        if self._head:
+            self._head -= 1
+            self._tracks[self._head] = track
+        else:
+            self._tracks.insert(0, track)
+        self.nbytes += track.nbytes
+        if self.journal:
+            self.journal.prepend(track)
+
+    def popleft(self) -> Track:
+        if not self:
+            raise IndexError('pop from an empty queue')
+        track = self._tracks[self._head]
+        self._tracks[self._head] = None
+        self._head += 1
+        self.nbytes -= track.nbytes
+        self._compact()
+        if self.journal:
+            self.journal.popleft()
+        return track
+
+    def remove(self, index: int) -> Track:
+        position = self._index(index)
+        track = self._tracks.pop(position)
+        self.nbytes -= track.nbytes
+        self._journal_reordered()
+        return track
+
+    def move(self, source: int, destination: int) -> Track:
+        track = self._tracks.pop(self._index(source))
+        destination = max(0, min(destination if destination >= 0 else len(self) + destination + 1, len(self)))
+        self._tracks.insert(self._head + destination, track)
+        self._journal_reordered()
+        return track
+
+    def shuffle(self, start: int = 0) -> None:
+        tracks = self._tracks[self._head + start:]
+        random.shuffle(tracks)
+        self._tracks[self._head + start:] = tracks
+        self._journal_reordered()
+
+    def dedupe(self) -> int:
+        seen = set()
+        kept = []
+        for track in self:
+            if track.webpage_url in seen:
+                self.nbytes -= track.nbytes
+                continue
+            seen.add(track.webpage_url)
+            kept.append(track)
+        removed = len(self) - len(kept)
+        self._tracks = kept
+        self._head = 0
+        if removed:
+            self._journal_reordered()
+        return removed
+
+    def page(self, start: int, count: int) -> list[Track]:
+        start = max(0, start)
+        return self._tracks[self._head + start:self._head + start + count]
+
+    def clear(self) -> None:
+        self._tracks = []
+        self._head = 0
+        self.nbytes = 0
+        if self.journal:
+            self.journal.clear()
+
+    def settle(self) -> None:
+        if self.journal:
+            self.journal.settle()
+
+    def _journal_reordered(self) -> None:
+        if self.journal:
+            self.journal.replace(list(self))
+
+    def __getitem__(self, index: int) -> Track:
+        return self._tracks[self._index(index)]
+
+    def __iter__(self) -> Iterator[Track]:
+        return itertools.islice(self._tracks, self._head, None)
+
+    def __len__(self) -> int:
+        return len(self._tracks) - self._head
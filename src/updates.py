@@ -0,0 +1,111 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import discord
+
+import metrics
+
+
+UPDATE_RATE = 1.0
+UPDATE_BURST = 5
+NOTICE_LIMIT = 5
+
+
+class TokenBucket:
+    def __init__(self, rate: float = UPDATE_RATE, capacity: int = UPDATE_BURST) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> None:
+        self._refill()
+        while self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= 1
+
+
+class ChannelUpdater:
+    def __init__(self, channel: discord.abc.Messageable, bucket: Optional[TokenBucket] = None,
+                 notice_limit: int = NOTICE_LIMIT) -> None:
+        self.channel = channel
+        self.bucket = bucket or TokenBucket()
+        self.notice_limit = notice_limit
+        self.logger = logging.getLogger('discord.bot.updates')
+        self.messages: dict[Hashable, discord.Message] = {}
+        self._pending: OrderedDict[Hashable, tuple[dict[str, Any], bool]] = OrderedDict()
+        self._notices = 0
+        self._counter = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+    def update(self, key: Hashable, message: Optional[discord.Message] = None, final: bool = False,
+               **fields: Any) -> None:
+        if message is not None:
+            self.messages[key] = message
+        if key in self._pending:
+            metrics.UPDATES_DROPPED.inc('superseded')
+        self._pending[key] = (fields, final)
+        self._wake()
+
+    def notify(self, content: str) -> None:
+        if self._notices >= self.notice_limit:
+            metrics.UPDATES_DROPPED.inc('notice')
+            self.logger.debug(f"Dropped notice for channel {getattr(self.channel, 'id', None)}: {content}")
+            return
+        self._notices += 1
+        self._pending[('notice', next(self._counter))] = ({'content': content}, True)
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while self._pending:
+            await self.bucket.acquire()
+            if not self._pending:
+                break
+            key, (fields, final) = self._pending.popitem(last=False)
+            if isinstance(key, tuple) and key[0] == 'notice':
+                self._notices -= 1
+            try:
+                await self._deliver(key, fields, final)
+            except discord.HTTPException as e:
+                self.logger.warning(f"Failed to update message in channel {getattr(self.channel, 'id', None)}: {e}")
+            except Exception as e:
+                self.logger.error(f"Message update crashed: {e}")
+
+    async def _deliver(self, key: Hashable, fields: dict[str, Any], final: bool) -> None:
+        message = self.messages.pop(key, None) if final else self.messages.get(key)
+        if message is not None:
+            try:
+                await message.edit(**fields)
+                return
+            except discord.NotFound:
+                self.messages.pop(key, None)
+        message = await self.channel.send(**fields)
+        if not final:
+            self.messages[key] = message
+
+    async def drain(self, timeout: float = 5) -> None:
+        if self._task and not self._task.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout)
+            except asyncio.TimeoutError:
+                self.logger.debug(f"Gave up delivering updates to channel {getattr(self.channel, 'id', None)}")
+        self.close()
+
+    def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+        self._pending.clear()
+        self._notices = 0
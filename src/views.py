@@ -0,0 +1,91 @@
+import discord
+from discord import ui
+
+
+QUEUE_PAGE_SIZE = 10
+
+
+class MusicControlView(ui.View):
+    def __init__(self, bot):
+        super().__init__(timeout=None)
+        self.bot = bot
+
+    @ui.button(label="⏸️ Pause", style=discord.ButtonStyle.primary, custom_id="pause_button")
+    async def pause_button(self, interaction: discord.Interaction, button: ui.Button):
+        voice = discord.utils.get(self.bot.voice_clients, guild=interaction.guild)
+        if voice and voice.is_playing():
+            voice.pause()
+            await interaction.response.send_message("⏸️ Paused", ephemeral=True)
+        else:
+            await interaction.response.send_message("❌ Nothing is playing!", ephemeral=True)
+
+    @ui.button(label="▶️ Resume", style=discord.ButtonStyle.success, custom_id="resume_button")
+    async def resume_button(self, interaction: discord.Interaction, button: ui.Button):
+        voice = discord.utils.get(self.bot.voice_clients, guild=interaction.guild)
+        if voice and voice.is_paused():
+            voice.resume()
+            await interaction.response.send_message("▶️ Resumed", ephemeral=True)
+        else:
+            await interaction.response.send_message("❌ Nothing is paused!", ephemeral=True)
+
+    @ui.button(label="⏭️ Skip", style=discord.ButtonStyle.secondary, custom_id="skip_button")
+    async def skip_button(self, interaction: discord.Interaction, button: ui.Button):
+        voice = discord.utils.get(self.bot.voice_clients, guild=interaction.guild)
+        if voice and (voice.is_playing() or voice.is_paused()):
+            voice.stop()
+            await interaction.response.send_message("⏭️ Skipped", ephemeral=True)
+        else:
+            await interaction.response.send_message("❌ Nothing is playing!", ephemeral=True)
+
+    @ui.button(label="⏹️ Stop", style=discord.ButtonStyle.danger, custom_id="stop_button")
+    async def stop_button(self, interaction: discord.Interaction, button: ui.Button):
+        player = self.bot.players.get(interaction.guild.id)
+        if player and player.is_active():
+            player.stop()
+            await interaction.response.send_message("⏹️ Stopped and cleared queue", ephemeral=True)
+        else:
+            await interaction.response.send_message("❌ Nothing is playing!", ephemeral=True)
+
+    @ui.button(label="📜 Queue", style=discord.ButtonStyle.secondary, custom_id="queue_button")
+    async def queue_button(self, interaction: discord.Interaction, button: ui.Button):
+        player = self.bot.players.get(interaction.guild.id)
+        if player and player.queue:
+            view = QueueView(player)
+            await interaction.response.send_message(embed=view.create_embed(), view=view, ephemeral=True)
+        else:
+            await interaction.response.send_message("📭 The queue is empty!", ephemeral=True)
+
+
+class QueueView(ui.View):
+    def __init__(self, player, page: int = 0):
+        super().__init__(timeout=180)
+        self.player = player
+        self.page = page
+
+    def page_count(self) -> int:
+        return max(1, -(-len(self.player.queue) // QUEUE_PAGE_SIZE))
+
+    def create_embed(self) -> discord.Embed:
+        queue = self.player.queue
+        self.page = max(0, min(self.page, self.page_count() - 1))
+        start = self.page * QUEUE_PAGE_SIZE
+        embed = discord.Embed(title="📜 Queue", color=discord.Color.blue())
+        if queue:
+            embed.description = '\n'.join([f"`{start + i + 1}.` {video.title[:60]}"
+                                           for i, video in enumerate(queue.page(start, QUEUE_PAGE_SIZE))])
+        else:
+            embed.description = "📭 The queue is empty!"
+        embed.set_footer(text=f"Page {self.page + 1}/{self.page_count()} | Total: {len(queue)} songs")
+        self.previous_button.disabled = self.page == 0
+        self.next_button.disabled = self.page >= self.page_count() - 1
+        return embed
+
+    @ui.button(label="◀️ Prev", style=discord.ButtonStyle.secondary)
+    async def previous_button(self, interaction: discord.Interaction, button: ui.Button):
+        self.page -= 1
+        await interaction.response.edit_message(embed=self.create_embed(), view=self)
+
+    @ui.button(label="Next ▶️", style=discord.ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, button: ui.Button):
+        self.page += 1
+        await interaction.response.edit_message(embed=self.create_embed(), view=self)